@@ -0,0 +1,80 @@
+"""
+Módulo responsável pelo cache em memória das consultas de livros
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Obtém a configuração do cache das variáveis de ambiente
+CACHE_TAMANHO = int(os.getenv("LIVROS_CACHE_TAMANHO", "1024"))
+CACHE_TTL = float(os.getenv("LIVROS_CACHE_TTL", "30"))
+
+# Define a classe de cache LRU com tempo de expiração
+class CacheLRU:
+    """
+    Cache LRU limitado a `tamanho` itens, onde cada item expira após `ttl` segundos.
+
+    O cache é local ao processo. As rotas assíncronas o acessam da thread do
+    event loop, mas os contadores são lidos pelos callbacks das métricas na
+    thread do leitor de métricas do OpenTelemetry. O lock mantém o OrderedDict
+    e os contadores consistentes entre threads, o que também permite usar o
+    cache nas funções síncronas executadas com run_in_threadpool, como a
+    importação de livros.
+    """
+    def __init__(self, tamanho: int, ttl: float):
+        self.tamanho = tamanho
+        self.ttl = ttl
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirados = 0
+
+    def busca(self, chave):
+        """
+        Retorna o valor armazenado ou None se a chave não existir ou tiver expirado.
+        """
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                self.misses += 1
+                return None
+            valor, expira_em = item
+            if expira_em <= time.monotonic():
+                del self._itens[chave]
+                self.expirados += 1
+                self.misses += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.hits += 1
+            return valor
+
+    def armazena(self, chave, valor):
+        """
+        Armazena o valor, descartando o item usado há mais tempo se o cache estiver cheio.
+        """
+        with self._lock:
+            self._itens[chave] = (valor, time.monotonic() + self.ttl)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho:
+                self._itens.popitem(last=False)
+                self.evictions += 1
+
+    def invalida(self, chave):
+        """
+        Remove a chave do cache, se existir.
+        """
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def limpa(self):
+        """
+        Remove todos os itens do cache.
+        """
+        with self._lock:
+            self._itens.clear()
+
+# Cache compartilhado das buscas de livro por id
+livros_cache = CacheLRU(tamanho=CACHE_TAMANHO, ttl=CACHE_TTL)
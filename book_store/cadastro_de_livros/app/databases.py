@@ -2,9 +2,16 @@
 Módulo responsável por criar a conexão com o banco de dados
 """
 import os
+import time
+from contextlib import asynccontextmanager
+from fastapi.concurrency import run_in_threadpool
+from opentelemetry import metrics
+from opentelemetry.metrics import Observation
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlalchemy_utils import database_exists, create_database
 from . import logger
 
@@ -16,9 +23,76 @@ DB_NAME = os.getenv("POSTGRES_DB")
 
 # URL de conexão com o banco de dados
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:5432/{DB_NAME}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:5432/{DB_NAME}"
+
+# Define se as rotas usam o driver assíncrono (asyncpg) ou o síncrono (psycopg2)
+DB_ASYNC = os.getenv("DB_ASYNC", "true").lower() == "true"
+
+# Obtém a configuração do pool de conexões das variáveis de ambiente
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+
+# Obtém o medidor para as métricas do pool de conexões
+meter = metrics.get_meter(__name__)
+
+# Cria a métrica do tempo de espera por uma conexão do pool
+espera_conexao = meter.create_histogram(
+    name="bookstore.db.pool.espera",
+    description="Tempo para obter uma conexão do pool",
+    unit="ms",
+)
+
+# Define o pool de conexões que mede o tempo de espera por uma conexão
+class PoolMedido:
+    """
+    Pool que registra quanto tempo cada checkout aguardou uma conexão,
+    incluindo a espera por uma conexão livre quando o pool está esgotado.
+    """
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            espera_conexao.record((time.perf_counter() - inicio) * 1000, {"driver": self._driver})
+
+class QueuePoolMedido(PoolMedido, QueuePool):
+    _driver = "psycopg2"
+
+class AsyncQueuePoolMedido(PoolMedido, AsyncAdaptedQueuePool):
+    _driver = "asyncpg"
+
+# Configuração comum aos pools de conexões
+POOL_CONFIG = dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    pool_recycle=DB_POOL_RECYCLE,
+)
 
 # Cria a engine de conexão com o banco de dados
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, poolclass=QueuePoolMedido, **POOL_CONFIG)
+
+# Cria a engine assíncrona de conexão com o banco de dados
+async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=AsyncQueuePoolMedido, **POOL_CONFIG)
+
+# Função de callback que lê o estado dos pools de conexões
+def observa_pool(options):
+    for driver, pool in (("psycopg2", engine.pool), ("asyncpg", async_engine.pool)):
+        yield Observation(pool.checkedout(), {"estado": "em_uso", "driver": driver})
+        yield Observation(pool.checkedin(), {"estado": "ociosa", "driver": driver})
+        yield Observation(max(pool.overflow(), 0), {"estado": "overflow", "driver": driver})
+
+# Cria a métrica com as conexões do pool por estado
+conexoes_pool = meter.create_observable_gauge(
+    name="bookstore.db.pool.conexoes",
+    callbacks=[observa_pool],
+    description="Conexões do pool por estado (em_uso, ociosa, overflow)",
+    unit="number",
+)
 
 # Verifica e cria o banco de dados, caso necessário
 def initialize_database():
@@ -27,31 +101,81 @@ def initialize_database():
     """
     try:
         if not database_exists(engine.url):
-            logger.info(f"Banco de dados {DB_NAME} não existe. Criando...")
+            logger.info("Banco de dados %s não existe. Criando...", DB_NAME)
             create_database(engine.url)
         else:
-            logger.info(f"Banco de dados {DB_NAME} já existe.")
+            logger.info("Banco de dados %s já existe.", DB_NAME)
     except Exception as e:
-        logger.error(f"Erro ao inicializar o banco de dados: {e}")
+        logger.error("Erro ao inicializar o banco de dados: %s", e)
         raise
 
-initialize_database()
-
 # Configura a sessão do banco de dados
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
-# Função que retorna uma sessão do banco de dados
-def get_db():
+# Define o adaptador que expõe uma sessão síncrona com a interface da AsyncSession
+class SessaoSincrona:
     """
-    Obtém uma nova sessão do banco de dados.
+    Executa as operações de uma Session síncrona no pool de threads, com a
+    mesma interface aguardável da AsyncSession. Assim as funções de models.py
+    são escritas uma única vez e funcionam com os dois drivers.
+    """
+    def __init__(self, db):
+        self.sync_session = db
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    async def execute(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.execute, *args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, *args, **kwargs)
+
+    async def scalars(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalars, *args, **kwargs)
+
+    async def delete(self, instance):
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self):
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def refresh(self, instance):
+        await run_in_threadpool(self.sync_session.refresh, instance)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+# Abre uma sessão do banco de dados com o driver configurado em DB_ASYNC
+@asynccontextmanager
+async def abre_sessao():
+    """
+    Abre uma AsyncSession (asyncpg) ou uma Session síncrona (psycopg2)
+    adaptada, conforme DB_ASYNC.
     """
-    db = SessionLocal()
+    db = AsyncSessionLocal() if DB_ASYNC else SessaoSincrona(SessionLocal())
     try:
         yield db
-    except Exception as e:
-        db.rollback()
-        raise
     finally:
-        db.close()
-        logger.info("Conexão com o banco de dados encerrada.")
+        await db.close()
+
+# Função que retorna uma sessão do banco de dados
+async def get_db():
+    """
+    Obtém uma nova sessão do banco de dados.
+    """
+    async with abre_sessao() as db:
+        try:
+            yield db
+        except Exception as e:
+            await db.rollback()
+            raise
+    logger.debug("Conexão com o banco de dados encerrada.")
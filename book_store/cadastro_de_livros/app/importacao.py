@@ -0,0 +1,141 @@
+"""
+Módulo responsável por converter o corpo da importação em massa para o COPY do Postgres
+"""
+import codecs
+import csv
+import json
+import anyio
+
+# Tipos de conteúdo aceitos pela importação em massa
+TIPOS_ACEITOS = ("application/json", "application/x-ndjson", "text/csv")
+
+# Converte um livro recebido em uma tupla (titulo, estoque) validada
+def valida_livro(livro: dict):
+    """
+    Valida os campos de um livro e retorna a tupla (titulo, estoque).
+    """
+    try:
+        titulo = livro["titulo"]
+        estoque = int(livro["estoque"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Livro inválido: {livro!r}") from e
+    if not isinstance(titulo, str):
+        raise ValueError(f"Livro inválido: {livro!r}")
+    return titulo, estoque
+
+# Lê os blocos do corpo da requisição a partir da thread da importação
+def blocos_da_requisicao(request):
+    """
+    Gera os blocos de bytes de `request.stream()` para o código síncrono
+    executado com run_in_threadpool. Cada bloco é lido no event loop com
+    anyio.from_thread.run, então o corpo é recebido conforme o COPY consome
+    as linhas, sem ser acumulado em memória.
+    """
+    stream = request.stream()
+
+    async def proximo():
+        try:
+            return await stream.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    while (bloco := anyio.from_thread.run(proximo)) is not None:
+        yield bloco
+
+# Divide os blocos de bytes em linhas, mantendo o fim de linha
+def linhas(blocos):
+    """
+    Gera cada linha assim que ela termina, sem juntar os blocos seguintes.
+    """
+    partes = []
+    for bloco in blocos:
+        inicio = 0
+        fim = bloco.find(b"\n")
+        while fim >= 0:
+            partes.append(bloco[inicio:fim + 1])
+            yield b"".join(partes)
+            partes = []
+            inicio = fim + 1
+            fim = bloco.find(b"\n", inicio)
+        if inicio < len(bloco):
+            partes.append(bloco[inicio:])
+    if partes:
+        yield b"".join(partes)
+
+# Lê os livros de um array JSON
+def le_json(blocos):
+    """
+    Retorna os livros de um array JSON. O array é validado inteiro pelo
+    json.loads, então este é o único formato que junta o corpo em memória.
+    """
+    livros = json.loads(b"".join(blocos))
+    if not isinstance(livros, list):
+        raise ValueError("O corpo deve ser um array JSON de livros")
+    for livro in livros:
+        yield valida_livro(livro)
+
+# Lê os livros de um corpo NDJSON, um livro por linha
+def le_ndjson(blocos):
+    """
+    Retorna os livros de um corpo NDJSON, linha a linha, ignorando linhas vazias.
+    """
+    for linha in linhas(blocos):
+        if linha.strip():
+            yield valida_livro(json.loads(linha))
+
+# Lê os livros de um CSV com cabeçalho titulo,estoque
+def le_csv(blocos):
+    """
+    Retorna os livros de um CSV com as colunas titulo e estoque, linha a linha.
+    """
+    for livro in csv.DictReader(codecs.iterdecode(linhas(blocos), "utf-8")):
+        yield valida_livro(livro)
+
+# Seleciona o leitor de acordo com o tipo de conteúdo
+def le_livros(tipo: str, blocos):
+    """
+    Retorna um iterador de tuplas (titulo, estoque) para o tipo de conteúdo
+    informado, lendo o corpo a partir dos `blocos` de bytes.
+    """
+    if tipo == "application/x-ndjson":
+        return le_ndjson(blocos)
+    if tipo == "text/csv":
+        return le_csv(blocos)
+    return le_json(blocos)
+
+# Converte as tuplas de livros em linhas CSV no formato esperado pelo COPY
+def linhas_csv(livros):
+    """
+    Gera uma linha CSV por livro, sempre com o título entre aspas.
+    """
+    for titulo, estoque in livros:
+        yield '"' + titulo.replace('"', '""') + '",' + str(estoque) + "\n"
+
+# Define um arquivo somente leitura sobre um iterador de linhas
+class LeitorLinhas:
+    """
+    Objeto com o método read() consumido pelo copy_expert do psycopg2.
+
+    As linhas são geradas sob demanda, então o CSV completo nunca é montado em
+    memória. Erros de validação ficam guardados em `erro`, pois o psycopg2
+    substitui a exceção original ao abortar o COPY.
+    """
+    def __init__(self, linhas):
+        self._linhas = iter(linhas)
+        self._buffer = ""
+        self.erro = None
+
+    def read(self, size: int = -1):
+        try:
+            while size < 0 or len(self._buffer) < size:
+                try:
+                    self._buffer += next(self._linhas)
+                except StopIteration:
+                    break
+        except Exception as e:
+            self.erro = e
+            raise
+        if size < 0:
+            size = len(self._buffer)
+        dados, self._buffer = self._buffer[:size], self._buffer[size:]
+        return dados
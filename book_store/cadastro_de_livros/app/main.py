@@ -1,79 +1,282 @@
 """
 Função principal que cria a aplicação FastAPI
 """
-from fastapi import FastAPI, HTTPException, Depends
-from sqlalchemy.orm import Session
+import json
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from . import models
+from .importacao import TIPOS_ACEITOS, blocos_da_requisicao, le_livros
+from . import metrics  # Registra as métricas do cache de livros
+from .inicializacao import inicializa
 from . import logger
-from .databases import engine, get_db
+from .databases import get_db, SessionLocal
 
-# Cria as tabelas no banco de dados
-models.Base.metadata.create_all(bind=engine)
+# Quantidade máxima de ids aceitos na busca em lote
+MAX_IDS_POR_BUSCA = 1000
+
+# Prepara o banco de dados na inicialização da aplicação
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(inicializa)
+    yield
 
 # Cria a aplicação FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Define a rota para criar um livro
 @app.post("/livros/")
-def cria_livro(livro: models.LivroBase, db: Session = Depends(get_db)):
+async def cria_livro(livro: models.LivroBase, db: AsyncSession = Depends(get_db)):
     """
     Rota para criar um livro
     """
     try:
-        logger.info(f"Criando livro: {livro}")
-        novo_livro = models.cria_livro(db=db, livro=livro)
-        logger.info(f"Livro criado com sucesso: {livro}")
+        logger.info("Criando livro: %s", livro)
+        novo_livro = await models.cria_livro(db=db, livro=livro)
+        logger.info("Livro criado com sucesso: %s", livro)
         return novo_livro
     except Exception as e:
-        logger.error(f"Erro ao criar livro: {e}")
+        logger.error("Erro ao criar livro: %s", e)
         raise HTTPException(status_code=500, detail="Erro ao criar livro")
 
+# Define a rota para importar livros em massa
+@app.post("/livros/bulk")
+async def importa_livros(request: Request):
+    """
+    Rota para importar livros em massa a partir de JSON, NDJSON ou CSV.
+
+    Em NDJSON e CSV o corpo é lido em blocos durante o COPY, então a
+    importação não acumula o arquivo em memória.
+    """
+    tipo = request.headers.get("content-type", "application/json").split(";")[0].strip()
+    if tipo not in TIPOS_ACEITOS:
+        raise HTTPException(status_code=415, detail=f"Tipo de conteúdo não suportado: {tipo}")
+    try:
+        logger.info("Importando livros em massa (%s)", tipo)
+
+        # O COPY é bloqueante, então é executado no pool de threads, que lê o corpo da requisição em blocos
+        resultado = await run_in_threadpool(_importa_livros, le_livros(tipo, blocos_da_requisicao(request)))
+        logger.info("Livros importados", extra={"campos": resultado})
+        return resultado
+    except ValueError as e:
+        logger.warning("Dados inválidos na importação de livros: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Erro ao importar livros: %s", e)
+        raise HTTPException(status_code=500, detail="Erro ao importar livros")
+
+# Importa os livros com uma sessão síncrona própria
+def _importa_livros(livros):
+    """
+    O COPY usa o copy_expert do psycopg2, então a importação não passa pela
+    sessão assíncrona de get_db.
+    """
+    db = SessionLocal()
+    try:
+        return models.importa_livros(db, livros)
+    finally:
+        db.close()
+
 @app.delete("/livros/{id}")
-def deleta_livro(id: int, db: Session = Depends(get_db)):
+async def deleta_livro(id: int, db: AsyncSession = Depends(get_db)):
     """
     Rota para deletar um livro pelo id
     """
     try:
-        logger.info(f"Deletando livro com id: {id}")
-        del_livro = models.remove_livro(db, id)
+        logger.info("Deletando livro com id: %s", id)
+        del_livro = await models.remove_livro(db, id)
         if del_livro is None:
-            logger.warning(f"Livro com id {id} não encontrado")
+            logger.warning("Livro com id %s não encontrado", id)
             raise HTTPException(status_code=404, detail="Livro não encontrado")
-        logger.info(f"Livro com ID: {id} deletado com sucesso")
+        logger.info("Livro com ID: %s deletado com sucesso", id)
         return del_livro
     except Exception as e:
-        logger.error(f"Erro ao deletar livro: {e}")
+        logger.error("Erro ao deletar livro: %s", e)
         raise HTTPException(status_code=500, detail="Erro ao deletar livro")
 
+# Define a rota para reservar estoque de um livro
+@app.post("/livros/{id}/reservas")
+async def reserva_livro(id: int, reserva: models.Reserva, db: AsyncSession = Depends(get_db)):
+    """
+    Rota para reservar estoque de um livro de forma atômica
+    """
+    try:
+        logger.info("Reservando %s unidade(s) do livro com id: %s", reserva.quantidade, id)
+        livro = await models.reserva_estoque(db, id, reserva.quantidade)
+        if livro is not None:
+            logger.info("Reserva do livro com ID: %s realizada com sucesso", id)
+            return livro
+    except Exception as e:
+        logger.error("Erro ao reservar livro: %s", e)
+        raise HTTPException(status_code=500, detail="Erro ao reservar livro")
+
+    # O UPDATE não alterou nenhuma linha: o livro não existe ou não tem estoque
+    if await models.busca_livro(db, id) is None:
+        logger.warning("Livro com id %s não encontrado", id)
+        raise HTTPException(status_code=404, detail="Livro não encontrado")
+    logger.warning("Estoque insuficiente para o livro com id %s", id)
+    raise HTTPException(status_code=409, detail="Estoque insuficiente")
+
+# Define a rota para reservar estoque de vários livros
+@app.post("/livros/reservas", response_model=models.ReservaLoteResultado)
+async def reserva_livros(reserva: models.ReservaLote, db: AsyncSession = Depends(get_db)):
+    """
+    Rota para reservar estoque de vários livros em uma única transação.
+
+    Cada livro recebe a quantidade pedida ou o estoque disponível, o que for
+    menor; livros sem estoque aparecem com 0 reservados.
+    """
+    if len(reserva.quantidades) > MAX_IDS_POR_BUSCA:
+        raise HTTPException(status_code=400, detail=f"Informe no máximo {MAX_IDS_POR_BUSCA} livros")
+    try:
+        logger.info("Reservando estoque de %s livros", len(reserva.quantidades))
+        reservados = await models.reserva_estoques(db, reserva.quantidades)
+        nao_encontrados = [id_livro for id_livro in reserva.quantidades if id_livro not in reservados]
+        logger.info("Estoque de %s livros reservado, %s não encontrados", len(reservados), len(nao_encontrados))
+        return {"reservados": reservados, "nao_encontrados": nao_encontrados}
+    except Exception as e:
+        logger.error("Erro ao reservar livros: %s", e)
+        raise HTTPException(status_code=500, detail="Erro ao reservar livros")
+
+# Define a rota para liberar estoque reservado de um livro
+@app.delete("/livros/{id}/reservas")
+async def libera_livro(id: int, quantidade: int = Query(default=1, gt=0), db: AsyncSession = Depends(get_db)):
+    """
+    Rota para devolver ao estoque uma reserva que não será concluída
+    """
+    try:
+        logger.info("Liberando %s unidade(s) do livro com id: %s", quantidade, id)
+        livro = await models.libera_estoque(db, id, quantidade)
+    except Exception as e:
+        logger.error("Erro ao liberar livro: %s", e)
+        raise HTTPException(status_code=500, detail="Erro ao liberar livro")
+    if livro is None:
+        logger.warning("Livro com id %s não encontrado", id)
+        raise HTTPException(status_code=404, detail="Livro não encontrado")
+    logger.info("Reserva do livro com ID: %s liberada com sucesso", id)
+    return livro
+
+# Define a rota para pesquisar livros pelo título
+# Registrada antes de /livros/{id} para que "busca" não seja lido como um id
+@app.get("/livros/busca")
+async def pesquisa_livros(
+    response: Response,
+    q: str = Query(min_length=3, max_length=200),
+    limit: int = Query(default=20, ge=1, le=100),
+    after: str | None = Query(default=None, pattern=r"^[0-9.e+-]+:\d+$"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Rota para pesquisar livros pelo título.
+
+    Retorna até `limit` livros cujo título contém `q`, ignorando maiúsculas,
+    do mais parecido para o menos parecido com o termo. O cursor da próxima
+    página é informado no cabeçalho `X-Proximo-Cursor` e enviado em `after`.
+    """
+    cursor = None
+    if after is not None:
+        relevancia, _, livro_id = after.partition(":")
+        try:
+            cursor = (float(relevancia), int(livro_id))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+    try:
+        logger.info("Pesquisando livros com o termo: %s", q)
+        linhas = await models.pesquisa_livros(db, q, limit=limit, after=cursor)
+        logger.info("%s livros encontrados", len(linhas))
+        if len(linhas) == limit:
+            response.headers["X-Proximo-Cursor"] = f"{linhas[-1].relevancia}:{linhas[-1].Livros.id}"
+        return [linha.Livros for linha in linhas]
+    except Exception as e:
+        logger.error("Erro ao pesquisar livros: %s", e)
+        raise HTTPException(status_code=500, detail="Erro ao pesquisar livros")
+
 # Define a rota para listar livros por id
 @app.get("/livros/{id}")
-def busca_livro(id: int, db: Session = Depends(get_db)):
+async def busca_livro(id: int, db: AsyncSession = Depends(get_db)):
     """
     Rota para buscar um livro pelo id
     """
     try:
-        logger.info(f"Buscando livro com id: {id}")
-        livro = models.busca_livro(db, id)
+        logger.info("Buscando livro com id: %s", id)
+        livro = await models.busca_livro(db, id)
         if livro is None:
-            logger.warning(f"Livro com id {id} não encontrado")
+            logger.warning("Livro com id %s não encontrado", id)
             raise HTTPException(status_code=404, detail="Livro não encontrado")
-        logger.info(f"Livro com ID: {id} encontrado com sucesso")
+        logger.info("Livro com ID: %s encontrado com sucesso", id)
         return livro
     except Exception as e:
-        logger.error(f"Erro ao buscar livro: {e}")
+        logger.error("Erro ao buscar livro: %s", e)
         raise HTTPException(status_code=500, detail="Erro ao buscar livro")
 
-# Define a rota para listar todos os livros
+# Define a rota para listar os livros com paginação ou buscar vários livros por id
+# O caminho sem a barra final evita o redirecionamento 307 em GET /livros?ids=...
 @app.get("/livros/")
-def lista_livros(db: Session = Depends(get_db)):
+@app.get("/livros", include_in_schema=False)
+async def lista_livros(
+    response: Response,
+    limit: int = Query(default=100, ge=1, le=1000),
+    after: int | None = None,
+    formato: str = Query(default="json", pattern="^(json|ndjson)$"),
+    ids: str | None = Query(default=None, pattern=r"^\d+(,\d+)*$"),
+    db: AsyncSession = Depends(get_db),
+):
     """
-    Rota para listar todos os livros
+    Rota para listar os livros.
+
+    Por padrão retorna uma página de até `limit` livros após o id `after` e
+    informa o cursor da próxima página no cabeçalho `X-Proximo-Cursor`. Com
+    `formato=ndjson` retorna todos os livros como um stream NDJSON. Com
+    `ids=1,2,3` busca somente os livros informados.
     """
+    if ids is not None:
+        return await busca_livros(ids, db)
     try:
-        logger.info("Listando todos os livros")
-        livros = models.lista_livros(db)
-        logger.info(f"{len(livros)} livros encontrados")
+        if formato == "ndjson":
+            logger.info("Transmitindo livros em NDJSON a partir do id: %s", after)
+            return StreamingResponse(stream_livros(after), media_type="application/x-ndjson")
+
+        logger.info("Listando livros a partir do id: %s", after)
+        livros = await models.lista_livros(db, limit=limit, after=after)
+        logger.info("%s livros encontrados", len(livros))
+        if len(livros) == limit:
+            response.headers["X-Proximo-Cursor"] = str(livros[-1].id)
         return livros
     except Exception as e:
-        logger.error(f"Erro ao listar livros: {e}")
+        logger.error("Erro ao listar livros: %s", e)
         raise HTTPException(status_code=500, detail="Erro ao listar livros")
+
+# Busca vários livros por id em uma única consulta
+async def busca_livros(ids: str, db: AsyncSession):
+    """
+    Retorna os livros encontrados e os ids não encontrados.
+    """
+    livro_ids = [int(livro_id) for livro_id in ids.split(",")]
+    if len(livro_ids) > MAX_IDS_POR_BUSCA:
+        raise HTTPException(status_code=400, detail=f"Informe no máximo {MAX_IDS_POR_BUSCA} ids")
+    try:
+        logger.info("Buscando %s livros por id", len(livro_ids))
+        livros = await models.busca_livros(db, livro_ids)
+        nao_encontrados = [livro_id for livro_id in dict.fromkeys(livro_ids) if livro_id not in livros]
+        logger.info("%s livros encontrados, %s não encontrados", len(livros), len(nao_encontrados))
+        return {"encontrados": livros, "nao_encontrados": nao_encontrados}
+    except Exception as e:
+        logger.error("Erro ao buscar livros: %s", e)
+        raise HTTPException(status_code=500, detail="Erro ao buscar livros")
+
+# Gera as linhas NDJSON da listagem de livros
+def stream_livros(after: int | None):
+    """
+    Gera uma linha JSON por livro.
+
+    A sessão é aberta aqui e não via Depends(get_db) porque o FastAPI encerra
+    as dependências antes de começar a enviar o corpo da resposta.
+    """
+    db = SessionLocal()
+    try:
+        for livro in models.stream_livros(db, after=after):
+            yield json.dumps({"id": livro.id, "titulo": livro.titulo, "estoque": livro.estoque}) + "\n"
+    finally:
+        db.close()
@@ -0,0 +1,49 @@
+"""
+Módulo com as métricas do serviço de cadastro de livros.
+
+Usa somente a API do OpenTelemetry: as métricas são exportadas quando a
+aplicação é executada com o opentelemetry-instrument e não têm custo caso
+contrário.
+"""
+from opentelemetry import metrics
+from opentelemetry.metrics import Observation
+from .cache import livros_cache
+
+# Obtém o medidor do serviço
+meter = metrics.get_meter(__name__)
+
+# Funções de callback que leem os contadores mantidos pelo cache
+def observa_cache_hits(options):
+    yield Observation(livros_cache.hits)
+
+def observa_cache_misses(options):
+    yield Observation(livros_cache.misses)
+
+def observa_cache_evictions(options):
+    yield Observation(livros_cache.evictions, {"motivo": "capacidade"})
+    yield Observation(livros_cache.expirados, {"motivo": "expirado"})
+
+"""
+Definição das métricas do cache de livros
+"""
+
+cache_hits = meter.create_observable_counter(
+    name="bookstore.cache.livros.hits",
+    callbacks=[observa_cache_hits],
+    description="Buscas de livro atendidas pelo cache",
+    unit="number",
+)
+
+cache_misses = meter.create_observable_counter(
+    name="bookstore.cache.livros.misses",
+    callbacks=[observa_cache_misses],
+    description="Buscas de livro que precisaram consultar o banco de dados",
+    unit="number",
+)
+
+cache_evictions = meter.create_observable_counter(
+    name="bookstore.cache.livros.evictions",
+    callbacks=[observa_cache_evictions],
+    description="Livros removidos do cache por capacidade ou expiração",
+    unit="number",
+)
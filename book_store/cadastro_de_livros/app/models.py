@@ -1,10 +1,16 @@
 """
 Modulo responsável por manipular os dados do banco de dados
 """
-from sqlalchemy import Column, Integer, String
+import time
+from sqlalchemy import Column, Index, Integer, String, and_, any_, bindparam, cast, func, or_, select, text, update
+from sqlalchemy.dialects.postgresql import ARRAY, REAL
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from typing import Annotated
+from pydantic import BaseModel, Field
 from .databases import Base
+from .cache import livros_cache
+from .importacao import LeitorLinhas, linhas_csv
 from . import logger
 
 # Modelo Pydantic para para entrada livre de dados
@@ -15,6 +21,23 @@ class LivroBase(BaseModel):
     class Config:
         from_attributes = True
 
+# Modelo Pydantic que representa um livro cadastrado
+class Livro(LivroBase):
+    id: int
+
+# Modelo Pydantic para reserva e liberação de estoque
+class Reserva(BaseModel):
+    quantidade: int = Field(default=1, gt=0)
+
+# Modelo Pydantic para reserva de estoque de vários livros
+class ReservaLote(BaseModel):
+    quantidades: dict[int, Annotated[int, Field(gt=0)]] # Quantidade pedida, pelo id do livro
+
+# Modelo Pydantic com o resultado de uma reserva de vários livros
+class ReservaLoteResultado(BaseModel):
+    reservados: dict[int, int] # Quantidade reservada, pelo id do livro; pode ser menor que a pedida
+    nao_encontrados: list[int]
+
 # Define a classe Book que representa a tabela de livros no banco de dados
 class Livros(Base):
     __tablename__ = "livros"
@@ -22,56 +45,312 @@ class Livros(Base):
     titulo = Column(String, index=True)
     estoque = Column(Integer)
 
+    # Índice de trigramas (extensão pg_trgm) usado pela pesquisa por título
+    __table_args__ = (
+        Index("ix_livros_titulo_trgm", "titulo", postgresql_using="gin", postgresql_ops={"titulo": "gin_trgm_ops"}),
+    )
+
 # Função que cria um livro no banco de dados
-def cria_livro(db: Session, livro: LivroBase):
+async def cria_livro(db: AsyncSession, livro: LivroBase):
     """
     Função que cria um livro no banco de dados
     """
     try:
         db_livro = Livros(titulo=livro.titulo, estoque=livro.estoque)
         db.add(db_livro)
-        db.commit()
-        db.refresh(db_livro)
+        await db.commit()
+        await db.refresh(db_livro)
+
+        # Invalida o cache do livro criado
+        livros_cache.invalida(db_livro.id)
         
         return db_livro
     except Exception as e:
-        logger.error(f"Erro ao criar livro no banco de dados: {e}")
+        logger.error("Erro ao criar livro no banco de dados: %s", e)
+        raise
+
+# Função que importa livros em massa no banco de dados
+def importa_livros(db: Session, livros):
+    """
+    Função que importa livros em massa usando COPY ... FROM STDIN.
+
+    Recebe sempre uma Session síncrona, pois usa o copy_expert do psycopg2.
+    Os livros são copiados para uma tabela temporária e inseridos em `livros`
+    com um único INSERT ... SELECT, tudo na mesma transação. Assim o
+    RETURNING informa o intervalo de ids criados sem trazer cada id para a
+    aplicação.
+    """
+    inicio = time.perf_counter()
+    leitor = LeitorLinhas(linhas_csv(livros))
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(
+            "CREATE TEMP TABLE livros_importacao (titulo varchar, estoque integer) ON COMMIT DROP"
+        )
+        cursor.copy_expert(
+            "COPY livros_importacao (titulo, estoque) FROM STDIN WITH (FORMAT csv)", leitor
+        )
+        cursor.execute(
+            "WITH inseridos AS ("
+            " INSERT INTO livros (titulo, estoque)"
+            " SELECT titulo, estoque FROM livros_importacao RETURNING id"
+            ") SELECT count(*), min(id), max(id) FROM inseridos"
+        )
+        quantidade, primeiro_id, ultimo_id = cursor.fetchone()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        if leitor.erro is not None:
+            raise leitor.erro from None
+        logger.error("Erro ao importar livros no banco de dados: %s", e)
         raise
+    finally:
+        cursor.close()
+
+    duracao = time.perf_counter() - inicio
+    return {
+        "quantidade": quantidade,
+        "primeiro_id": primeiro_id,
+        "ultimo_id": ultimo_id,
+        "duracao_segundos": round(duracao, 3),
+        "livros_por_segundo": round(quantidade / duracao) if duracao > 0 else quantidade,
+    }
 
 # Função que remove um livro do banco de dados
-def remove_livro(db: Session, livro_id: int):
+async def remove_livro(db: AsyncSession, livro_id: int):
     """
     Função que remove um livro do banco de dados
     """
     try:
-        db_livro = db.query(Livros).filter(Livros.id == livro_id).first()
+        db_livro = await db.scalar(select(Livros).where(Livros.id == livro_id))
         if db_livro:
-            db.delete(db_livro)
-            db.commit()
+            await db.delete(db_livro)
+            await db.commit()
+
+            # Invalida o cache do livro removido
+            livros_cache.invalida(livro_id)
 
             return db_livro
     except Exception as e:
-        logger.error(f"Erro ao deletar livro com id {livro_id}: {e}")
+        logger.error("Erro ao deletar livro com id %s: %s", livro_id, e)
         raise
 
-# Função que retorna todos os livros do banco de dados
-def lista_livros(db: Session):
+# Função que retorna uma página de livros do banco de dados
+async def lista_livros(db: AsyncSession, limit: int = 100, after: int | None = None):
     """
-    Função que retorna todos os livros do banco de dados
+    Função que retorna uma página de livros ordenada por id.
+
+    Usa paginação por cursor (keyset): `after` é o último id recebido na
+    página anterior, então o banco usa o índice da chave primária em vez de
+    percorrer e descartar linhas como faria um OFFSET.
     """
     try:
-        return db.query(Livros).all()
+        query = select(Livros)
+        if after is not None:
+            query = query.where(Livros.id > after)
+        return (await db.scalars(query.order_by(Livros.id).limit(limit))).all()
     except Exception as e:
-        logger.error(f"Erro ao listar livros: {e}")
+        logger.error("Erro ao listar livros: %s", e)
+        raise
+
+# Escapa os curingas do LIKE para pesquisar o termo literalmente
+def _escapa_like(termo: str):
+    return termo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+# Função que pesquisa livros pelo título no banco de dados
+async def pesquisa_livros(db: AsyncSession, termo: str, limit: int = 20, after: tuple[float, int] | None = None):
+    """
+    Função que retorna uma página de livros cujo título contém `termo`.
+
+    O filtro ILIKE usa o índice GIN de trigramas, então o banco não percorre
+    a tabela inteira. Os livros são ordenados pela similaridade do título com
+    o termo (similarity do pg_trgm) e pelo id. Usa paginação por cursor:
+    `after` é o par (relevancia, id) do último livro da página anterior.
+    Retorna linhas com o livro (`Livros`) e a `relevancia`.
+    """
+    try:
+        relevancia = func.similarity(Livros.titulo, termo)
+        query = select(Livros, relevancia.label("relevancia")).where(
+            Livros.titulo.ilike(f"%{_escapa_like(termo)}%", escape="\\")
+        )
+        if after is not None:
+            # A relevância é um real: o cursor é convertido para o mesmo tipo antes da comparação
+            relevancia_after = cast(after[0], REAL)
+            query = query.where(
+                or_(relevancia < relevancia_after, and_(relevancia == relevancia_after, Livros.id > after[1]))
+            )
+        query = query.order_by(relevancia.desc(), Livros.id).limit(limit)
+        return (await db.execute(query)).all()
+    except Exception as e:
+        logger.error("Erro ao pesquisar livros com o termo %s: %s", termo, e)
+        raise
+
+# Função que percorre todos os livros do banco de dados em blocos
+def stream_livros(db: Session, after: int | None = None, chunk_size: int = 1000):
+    """
+    Função que retorna os livros um a um usando um cursor do lado do servidor.
+
+    As linhas são buscadas em blocos de `chunk_size`, então a memória usada
+    não depende do tamanho do catálogo. Recebe sempre uma Session síncrona,
+    pois é consumida pelo pool de threads durante o envio da resposta.
+    """
+    try:
+        query = db.query(Livros.id, Livros.titulo, Livros.estoque)
+        if after is not None:
+            query = query.filter(Livros.id > after)
+        for livro in query.order_by(Livros.id).yield_per(chunk_size):
+            yield livro
+    except Exception as e:
+        logger.error("Erro ao percorrer livros: %s", e)
         raise
 
 # Função que retorna um livro do banco de dados
-def busca_livro(db: Session, livro_id: int):
+async def busca_livro(db: AsyncSession, livro_id: int):
+    """
+    Função que retorna um livro do banco de dados.
+
+    Consulta primeiro o cache em memória e só acessa o banco de dados quando
+    o livro não está no cache ou a entrada expirou.
     """
-    Função que retorna um livro do banco de dados
+    try:
+        livro = livros_cache.busca(livro_id)
+        if livro is not None:
+            return livro
+
+        db_livro = await db.scalar(select(Livros).where(Livros.id == livro_id))
+        if db_livro is None:
+            return None
+
+        # Armazena uma cópia desacoplada da sessão no cache
+        livro = Livro.model_validate(db_livro)
+        livros_cache.armazena(livro_id, livro)
+        return livro
+    except Exception as e:
+        logger.error("Erro ao buscar livro com id %s: %s", livro_id, e)
+        raise
+
+# Função que retorna vários livros do banco de dados
+async def busca_livros(db: AsyncSession, livro_ids: list[int]):
+    """
+    Função que retorna um dicionário {id: livro} com os livros encontrados.
+
+    Usa o mesmo cache de busca_livro e consulta o banco de dados somente para
+    os ids ausentes do cache, com uma única query `id = ANY(:ids)`.
+    """
+    try:
+        livros = {}
+        faltando = []
+        for livro_id in dict.fromkeys(livro_ids):
+            livro = livros_cache.busca(livro_id)
+            if livro is None:
+                faltando.append(livro_id)
+            else:
+                livros[livro_id] = livro
+
+        if faltando:
+            ids = bindparam("ids", faltando, type_=ARRAY(Integer))
+            for db_livro in await db.scalars(select(Livros).where(Livros.id == any_(ids))):
+                livro = Livro.model_validate(db_livro)
+                livros_cache.armazena(livro.id, livro)
+                livros[livro.id] = livro
+
+        return livros
+    except Exception as e:
+        logger.error("Erro ao buscar livros com ids %s: %s", livro_ids, e)
+        raise
+
+# Função que reserva estoque de um livro no banco de dados
+async def reserva_estoque(db: AsyncSession, livro_id: int, quantidade: int):
+    """
+    Função que decrementa o estoque de um livro se houver quantidade suficiente.
+
+    A verificação e a atualização acontecem no mesmo UPDATE condicional, então
+    pedidos concorrentes nunca reservam a mesma unidade. Retorna o livro
+    atualizado ou None se o estoque for insuficiente ou o livro não existir.
     """
     try:
-        return db.query(Livros).filter(Livros.id == livro_id).first()
+        stmt = (
+            update(Livros)
+            .where(Livros.id == livro_id, Livros.estoque >= quantidade)
+            .values(estoque=Livros.estoque - quantidade)
+            .returning(Livros.id, Livros.titulo, Livros.estoque)
+        )
+        return await _atualiza_estoque(db, livro_id, stmt)
     except Exception as e:
-        logger.error(f"Erro ao buscar livro com id {livro_id}: {e}")
+        logger.error("Erro ao reservar estoque do livro com id %s: %s", livro_id, e)
         raise
+
+# Função que libera estoque reservado de um livro no banco de dados
+async def libera_estoque(db: AsyncSession, livro_id: int, quantidade: int):
+    """
+    Função que devolve ao estoque uma quantidade reservada anteriormente.
+
+    Retorna o livro atualizado ou None se o livro não existir.
+    """
+    try:
+        stmt = (
+            update(Livros)
+            .where(Livros.id == livro_id)
+            .values(estoque=Livros.estoque + quantidade)
+            .returning(Livros.id, Livros.titulo, Livros.estoque)
+        )
+        return await _atualiza_estoque(db, livro_id, stmt)
+    except Exception as e:
+        logger.error("Erro ao liberar estoque do livro com id %s: %s", livro_id, e)
+        raise
+
+# Reserva o estoque disponível de vários livros em um único comando
+RESERVA_LOTE = text("""
+WITH pedidos AS (
+    SELECT unnest(:ids) AS id, unnest(:quantidades) AS quantidade
+), atual AS (
+    SELECT livros.id, GREATEST(LEAST(COALESCE(livros.estoque, 0), pedidos.quantidade), 0) AS reservado
+    FROM livros JOIN pedidos ON pedidos.id = livros.id
+    ORDER BY livros.id
+    FOR UPDATE OF livros
+), atualizados AS (
+    UPDATE livros SET estoque = livros.estoque - atual.reservado
+    FROM atual
+    WHERE livros.id = atual.id AND atual.reservado > 0
+    RETURNING livros.id, livros.titulo, livros.estoque
+)
+SELECT atual.id, atual.reservado, atualizados.titulo, atualizados.estoque
+FROM atual LEFT JOIN atualizados ON atualizados.id = atual.id
+""").bindparams(bindparam("ids", type_=ARRAY(Integer)), bindparam("quantidades", type_=ARRAY(Integer)))
+
+# Função que reserva estoque de vários livros no banco de dados
+async def reserva_estoques(db: AsyncSession, quantidades: dict[int, int]):
+    """
+    Função que reserva, para cada livro, a quantidade pedida ou o estoque
+    disponível, o que for menor, e retorna {id do livro: quantidade reservada}.
+
+    Livros que não existem ficam fora do resultado. As linhas são travadas em
+    ordem de id e atualizadas no mesmo comando, então reservas concorrentes
+    nunca reservam a mesma unidade nem entram em deadlock entre si.
+    """
+    try:
+        linhas = (await db.execute(
+            RESERVA_LOTE, {"ids": list(quantidades), "quantidades": list(quantidades.values())}
+        )).all()
+        await db.commit()
+    except Exception as e:
+        logger.error("Erro ao reservar estoque de %s livros: %s", len(quantidades), e)
+        raise
+
+    reservados = {}
+    for linha in linhas:
+        reservados[linha.id] = linha.reservado
+        if linha.titulo is not None:
+            livros_cache.armazena(linha.id, Livro(id=linha.id, titulo=linha.titulo, estoque=linha.estoque))
+    return reservados
+
+# Executa a atualização de estoque e mantém o cache coerente
+async def _atualiza_estoque(db: AsyncSession, livro_id: int, stmt):
+    row = (await db.execute(stmt)).first()
+    await db.commit()
+    if row is None:
+        return None
+
+    livro = Livro(id=row.id, titulo=row.titulo, estoque=row.estoque)
+    livros_cache.armazena(livro_id, livro)
+    return livro
@@ -0,0 +1,109 @@
+"""
+Benchmark da pesquisa de livros por título com 1 milhão de livros.
+
+Compara duas formas de encontrar os livros cujo título contém um termo:
+
+- lista_e_filtra: percorre GET /livros/ em páginas de 1000 livros e filtra
+  os títulos na aplicação, como os clientes fazem sem a rota de busca
+- busca: uma página de GET /livros/busca, que usa o índice GIN de trigramas
+
+As duas versões chamam as funções de app.models diretamente, sem HTTP, então
+os tempos da lista_e_filtra são um limite inferior.
+
+O benchmark usa um banco de dados próprio (BENCHMARK_DB, padrão
+cadastro-livros-benchmark) no servidor de POSTGRES_HOST, que é criado e
+preenchido na primeira execução.
+
+Uso, no diretório cadastro_de_livros:
+
+    python -m benchmarks.busca [livros]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# Usa um banco de dados separado para não misturar os livros gerados com o catálogo
+os.environ["POSTGRES_DB"] = os.getenv("BENCHMARK_DB", "cadastro-livros-benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from sqlalchemy import func, select, text
+from app import models
+from app.databases import AsyncSessionLocal, engine
+from app.inicializacao import migra
+
+# Termos pesquisados, do mais comum (10% dos livros) ao mais raro (6 livros)
+TERMOS = ["Dragão", "Ilha de Vidro", "Jardim Secreto 1999"]
+
+# Quantidade de livros inseridos por INSERT na preparação
+LOTE = 100_000
+
+# Gera títulos combinando palavras, por exemplo "A Sombra do Vento 123"
+GERA_LIVROS = text("""
+INSERT INTO livros (titulo, estoque)
+SELECT
+    (ARRAY['O', 'A', 'Os', 'As', 'Um', 'Uma'])[1 + i % 6] || ' ' ||
+    (ARRAY['Sombra', 'Cidade', 'Dragão', 'Jardim', 'Livro', 'Mar', 'Guerra', 'Estrela', 'Ilha', 'Noite'])[1 + (i / 6) % 10] || ' ' ||
+    (ARRAY['do Vento', 'de Fogo', 'Perdido', 'Secreto', 'do Norte', 'das Almas', 'de Vidro', 'Esquecido'])[1 + (i / 60) % 8] || ' ' ||
+    (i / 480)::text,
+    i % 100
+FROM generate_series(:inicio, :fim) AS i
+""")
+
+# Cria as tabelas e completa o catálogo até a quantidade de livros pedida
+def prepara(quantidade: int):
+    migra()
+    with engine.begin() as conexao:
+        existentes = conexao.scalar(select(func.count()).select_from(models.Livros))
+    for inicio in range(existentes, quantidade, LOTE):
+        fim = min(inicio + LOTE, quantidade) - 1
+        with engine.begin() as conexao:
+            conexao.execute(GERA_LIVROS, {"inicio": inicio, "fim": fim})
+        print(f"{fim + 1} livros cadastrados", file=sys.stderr)
+    if existentes < quantidade:
+        with engine.connect() as conexao:
+            conexao.execution_options(isolation_level="AUTOCOMMIT").execute(text("ANALYZE livros"))
+
+# Percorre todas as páginas da listagem e filtra os títulos na aplicação
+async def lista_e_filtra(termo: str):
+    termo = termo.lower()
+    encontrados = []
+    after = None
+    async with AsyncSessionLocal() as db:
+        while True:
+            livros = await models.lista_livros(db, limit=1000, after=after)
+            encontrados.extend(livro for livro in livros if termo in livro.titulo.lower())
+            if len(livros) < 1000:
+                return encontrados
+            after = livros[-1].id
+
+# Busca a primeira página da pesquisa por título
+async def busca(termo: str):
+    async with AsyncSessionLocal() as db:
+        return await models.pesquisa_livros(db, termo, limit=20)
+
+# Retorna o resultado da função e o tempo mediano em milissegundos
+async def mede(funcao, termo: str, repeticoes: int):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = await funcao(termo)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return resultado, statistics.median(tempos)
+
+async def main(quantidade: int):
+    print(f"{quantidade} livros")
+    print(f"{'termo':<22}{'encontrados':>12}{'lista_e_filtra ms':>19}{'busca ms':>10}{'ganho':>8}")
+    for termo in TERMOS:
+        encontrados, tempo_lista = await mede(lista_e_filtra, termo, repeticoes=3)
+        _, tempo_busca = await mede(busca, termo, repeticoes=20)
+        print(
+            f"{termo:<22}{len(encontrados):>12}{tempo_lista:>19.1f}{tempo_busca:>10.2f}"
+            f"{tempo_lista / tempo_busca:>7.0f}x"
+        )
+
+if __name__ == "__main__":
+    quantidade = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    prepara(quantidade)
+    asyncio.run(main(quantidade))
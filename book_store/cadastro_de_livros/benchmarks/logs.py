@@ -0,0 +1,53 @@
+"""
+Benchmark do custo das chamadas de log por requisição com o nível WARNING.
+
+Repete as chamadas de log de uma requisição POST /livros/ (duas mensagens
+INFO com o livro e o fechamento da sessão) em duas versões:
+
+- fstring: logger padrão com f-strings, como antes
+- lazy: LoggerEstruturado com argumentos %s, como agora
+
+Com o nível WARNING nenhuma mensagem é emitida, então a diferença é o custo
+de formatar mensagens que seriam descartadas.
+
+Uso, no diretório cadastro_de_livros:
+
+    python -m benchmarks.logs [requisicoes]
+"""
+import logging
+import sys
+import timeit
+from pydantic import BaseModel
+from app.logs import LoggerEstruturado
+
+# Mesmo formato do modelo LivroBase de app.models
+class LivroBase(BaseModel):
+    titulo: str
+    estoque: int
+
+logger_padrao = logging.getLogger("benchmark.fstring")
+logger_estruturado = LoggerEstruturado(logging.getLogger("benchmark.lazy"))
+logging.getLogger("benchmark").setLevel(logging.WARNING)
+
+livro = LivroBase(titulo="O Senhor dos Anéis: A Sociedade do Anel", estoque=42)
+
+# Chamadas de log de uma requisição com f-strings
+def requisicao_fstring():
+    logger_padrao.info(f"Criando livro: {livro}")
+    logger_padrao.info(f"Livro criado com sucesso: {livro}")
+    logger_padrao.info("Conexão com o banco de dados encerrada.")
+
+# Chamadas de log de uma requisição com formatação adiada
+def requisicao_lazy():
+    logger_estruturado.info("Criando livro: %s", livro)
+    logger_estruturado.info("Livro criado com sucesso: %s", livro)
+    logger_estruturado.debug("Conexão com o banco de dados encerrada.")
+
+if __name__ == "__main__":
+    requisicoes = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f"{'versão':<10}{'µs/req':>10}")
+    resultados = {}
+    for nome, funcao in [("fstring", requisicao_fstring), ("lazy", requisicao_lazy)]:
+        resultados[nome] = min(timeit.repeat(funcao, number=requisicoes, repeat=5)) / requisicoes * 1_000_000
+        print(f"{nome:<10}{resultados[nome]:>10.2f}")
+    print(f"economia: {resultados['fstring'] - resultados['lazy']:.2f} µs/req")
@@ -1,8 +1,4 @@
 """
 Indica que o diretório é um pacote Python
 """
-import logging
-
-# Configuração global de logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
-logger = logging.getLogger(__name__)
+from .logs import logger
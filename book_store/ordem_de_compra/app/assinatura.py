@@ -0,0 +1,18 @@
+"""
+Módulo responsável pela assinatura das ordens enviadas ao serviço de pagamento
+"""
+import hashlib
+import hmac
+import os
+
+# Obtém o segredo compartilhado com o serviço de pagamento
+ORDEM_TOKEN_SEGREDO = os.getenv("ORDEM_TOKEN_SEGREDO")
+
+# Gera o token que comprova que a ordem foi criada por este serviço
+def assina_ordem(id_ordem: int):
+    """
+    Retorna o HMAC-SHA256 do id da ordem ou None se o segredo não estiver configurado.
+    """
+    if not ORDEM_TOKEN_SEGREDO:
+        return None
+    return hmac.new(ORDEM_TOKEN_SEGREDO.encode(), str(id_ordem).encode(), hashlib.sha256).hexdigest()
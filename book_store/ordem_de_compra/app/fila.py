@@ -0,0 +1,134 @@
+"""
+Módulo responsável pelos workers que publicam a fila de pagamentos (outbox)
+"""
+import asyncio
+import os
+import httpx
+from . import models
+from .databases import abre_sessao
+from .resiliencia import ServicoIndisponivel, pagamento
+from .servicos import envia_pagamentos, libera_reserva
+from . import logger
+
+# Obtém a configuração da fila de pagamentos das variáveis de ambiente
+PAGAMENTO_WORKERS = int(os.getenv("PAGAMENTO_WORKERS", "4"))
+PAGAMENTO_LOTE = int(os.getenv("PAGAMENTO_LOTE", "50"))
+PAGAMENTO_INTERVALO = float(os.getenv("PAGAMENTO_INTERVALO", "0.5"))
+PAGAMENTO_LEASE = float(os.getenv("PAGAMENTO_LEASE", "30"))
+PAGAMENTO_MAX_TENTATIVAS = int(os.getenv("PAGAMENTO_MAX_TENTATIVAS", "5"))
+
+# Sinaliza aos workers que há pagamentos novos na fila
+novos_pagamentos = asyncio.Event()
+
+# Acorda os workers após gravar pagamentos na fila
+def avisa_workers():
+    """
+    Chamada pelas rotas após o commit das ordens, para que um worker publique
+    os pagamentos sem esperar o fim do `PAGAMENTO_INTERVALO`.
+    """
+    novos_pagamentos.set()
+
+# Reserva um lote de pagamentos usando uma sessão própria
+async def _reserva_lote():
+    async with abre_sessao() as db:
+        return await models.reserva_pagamentos(db, limite=PAGAMENTO_LOTE, lease=PAGAMENTO_LEASE)
+
+# Grava o resultado de um lote de pagamentos usando uma sessão própria
+async def _conclui_lote(status_por_ordem):
+    async with abre_sessao() as db:
+        await models.conclui_pagamentos(db, status_por_ordem)
+
+# Devolve à fila, sem gastar tentativas, itens cujo envio foi recusado pela proteção do serviço
+async def _devolve_lote(id_itens):
+    async with abre_sessao() as db:
+        await models.devolve_pagamentos(db, id_itens)
+
+# Processa um lote de pagamentos da fila
+async def processa_lote(http: httpx.AsyncClient):
+    """
+    Reserva um lote, publica os pagamentos em uma única chamada ao serviço de
+    pagamento e grava os resultados.
+
+    A entrega é at-least-once: um item só sai da fila depois que o resultado
+    é gravado, e o serviço de pagamento é idempotente por ordem. Itens sem
+    resultado continuam na fila até o lease expirar ou as tentativas acabarem.
+    Quando o circuito ou o limite do serviço de pagamento recusaria a chamada
+    nada é reservado; se a chamada ainda assim for recusada, os itens voltam
+    para a fila sem gastar a tentativa. Retorna a quantidade de itens
+    processados.
+    """
+    if not pagamento.disponivel():
+        return 0
+
+    itens = await _reserva_lote()
+    if not itens:
+        return 0
+
+    try:
+        status_enviados = await envia_pagamentos(http, [item.id_ordem for item in itens])
+    except ServicoIndisponivel as e:
+        logger.warning("Lote de %s pagamentos devolvido à fila: %s", len(itens), e)
+        await _devolve_lote([item.id for item in itens])
+        return 0
+    except Exception as e:
+        logger.error("Erro ao publicar lote de %s pagamentos: %s", len(itens), e)
+        status_enviados = {}
+
+    status_por_ordem = {}
+    liberar = []
+    for item in itens:
+        status = status_enviados.get(item.id_ordem)
+        if status is None:
+            if item.tentativas < PAGAMENTO_MAX_TENTATIVAS:
+                continue
+            logger.error("Pagamento da ordem %s falhou após %s tentativas", item.id_ordem, item.tentativas)
+            status = "Falha no Pagamento"
+        status_por_ordem[item.id_ordem] = status
+        # Devolve a unidade reservada quando a ordem não será concluída
+        if status != "Concluído":
+            liberar.append(item.id_livro)
+
+    if status_por_ordem:
+        await _conclui_lote(status_por_ordem)
+        await asyncio.gather(*(libera_reserva(http, id_livro) for id_livro in liberar))
+    logger.info("Lote de pagamentos processado: %s de %s concluídos", len(status_por_ordem), len(itens))
+    return len(itens)
+
+# Loop de um worker da fila de pagamentos
+async def worker(http: httpx.AsyncClient, numero: int):
+    """
+    Processa lotes continuamente. Quando a fila está vazia, aguarda até
+    `PAGAMENTO_INTERVALO` segundos ou até uma rota chamar avisa_workers.
+    """
+    logger.info("Worker de pagamentos %s iniciado", numero)
+    while True:
+        try:
+            processados = await processa_lote(http)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Erro no worker de pagamentos %s: %s", numero, e)
+            processados = 0
+        if processados < PAGAMENTO_LOTE:
+            try:
+                await asyncio.wait_for(novos_pagamentos.wait(), PAGAMENTO_INTERVALO)
+            except asyncio.TimeoutError:
+                pass
+            novos_pagamentos.clear()
+
+# Inicia o pool de workers da fila de pagamentos
+def inicia_workers(http: httpx.AsyncClient):
+    """
+    Cria `PAGAMENTO_WORKERS` tarefas que drenam a fila de pagamentos.
+    """
+    return [asyncio.create_task(worker(http, numero)) for numero in range(PAGAMENTO_WORKERS)]
+
+# Encerra o pool de workers da fila de pagamentos
+async def encerra_workers(workers):
+    """
+    Cancela os workers e aguarda o encerramento. Itens em andamento voltam
+    para a fila quando o lease expirar.
+    """
+    for tarefa in workers:
+        tarefa.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,36 @@
+"""
+Módulo responsável pelo cliente HTTP compartilhado nas chamadas entre serviços
+"""
+import os
+import httpx
+from fastapi import Request
+
+# Obtém a configuração do pool de conexões das variáveis de ambiente
+HTTP_MAX_CONEXOES = int(os.getenv("HTTP_MAX_CONEXOES", "200"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "50"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "5"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "1"))
+
+# Cria o cliente HTTP assíncrono com pool de conexões
+def cria_http_client():
+    """
+    Cria um cliente HTTP assíncrono que reutiliza conexões keep-alive.
+
+    Deve ser criado uma única vez por processo, no lifespan da aplicação.
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONEXOES,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+    )
+
+# Função que retorna o cliente HTTP da aplicação
+def get_http_client(request: Request):
+    """
+    Obtém o cliente HTTP compartilhado criado no lifespan da aplicação.
+    """
+    return request.app.state.http_client
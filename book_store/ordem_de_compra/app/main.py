@@ -1,77 +1,215 @@
 """
 Função principal que cria a aplicação FastAPI
 """
-import os
-from fastapi import FastAPI, HTTPException, Depends
-from sqlalchemy.orm import Session
-import requests
+from collections import Counter
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Header, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+import httpx
 from . import models
-from .databases import engine, get_db
+from .databases import get_db
+from .fila import avisa_workers, inicia_workers, encerra_workers
+from .http_client import cria_http_client, get_http_client
+from .inicializacao import inicializa
+from .resiliencia import ServicoIndisponivel
+from .servicos import libera_reserva, libera_reservas, reserva_livro, reserva_livros
 from . import logger
 
-# Obtém url dos serviços pagamento e cadastro de livros
-PAYMENT_URL = os.getenv("PAYMENT_URL", "http://pagamento:8082")
-BOOK_URL = os.getenv("BOOK_URL", "http://cadastro_de_livros:8080")
+# Quantidade máxima de ordens aceitas em um pedido em lote
+MAX_ORDENS_POR_LOTE = 1000
 
-# Cria as tabelas no banco de dados
-models.Base.metadata.create_all(bind=engine)
+# Prepara o banco de dados, cria e encerra o cliente HTTP compartilhado e os workers de pagamento junto com a aplicação
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(inicializa)
+    app.state.http_client = cria_http_client()
+    workers = inicia_workers(app.state.http_client)
+    yield
+    await encerra_workers(workers)
+    await app.state.http_client.aclose()
 
 # Cria a aplicação FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Define a rota para criar uma ordem
 @app.post("/ordens/", response_model=models.Ordem)
-def cria_ordem(ordem: models.OrdemCreate, db: Session = Depends(get_db)):
+async def cria_ordem(
+    ordem: models.OrdemCreate,
+    response: Response,
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key", max_length=255),
+    db: AsyncSession = Depends(get_db),
+    http: httpx.AsyncClient = Depends(get_http_client),
+):
     """
-    Rota para criar uma ordem de compra de um livro
+    Rota para criar uma ordem de compra de um livro.
+
+    A ordem e o seu pagamento pendente são gravados em uma única transação e
+    a rota responde 202 sem aguardar o serviço de pagamento: os workers da
+    fila publicam o pagamento e o status final é consultado em GET /ordens/{id}.
+
+    Com o cabeçalho Idempotency-Key, repetir a requisição com a mesma chave
+    retorna a ordem já criada sem chamar os outros serviços.
     """
+    # Retorna a ordem já criada com a mesma chave de idempotência
+    if idempotency_key is not None:
+        db_ordem = await models.busca_ordem_por_chave(db=db, chave_idempotencia=idempotency_key)
+        if db_ordem is not None:
+            logger.info("Ordem %s retornada pela chave de idempotência", db_ordem.id)
+            return db_ordem
+
     try:
-        # Valida disponibilidade do livro no serviço de cadastro de livros
-        livro_response = requests.get(f"{BOOK_URL}/livros/{ordem.id_livro}")
-        if livro_response.status_code != 200:
+        # Reserva uma unidade do livro no serviço de cadastro de livros
+        reserva_response = await reserva_livro(http, ordem.id_livro)
+        if reserva_response.status_code == 404:
             raise HTTPException(status_code=404, detail="Livro não encontrado")
-        
-        # Valida se o livro está disponível em estoque
-        livro = livro_response.json()
-        if livro["estoque"] <= 0:
-            raise HTTPException(status_code=404, detail="Livro esgotado")
-        
-        # Cria ordem de compra
-        db_ordem = models.cria_ordem(db=db, ordem=ordem)
-        
-        # Enviar pagamento para o serviço de Pagamento 
-        pagamento_response = requests.post(f"{PAYMENT_URL}/pagamentos", json={"id_ordem": db_ordem.id}) 
-        if pagamento_response.status_code != 200: 
-            raise HTTPException(status_code=400, detail="Falha no processamento do pagamento")
-        pagamento_response = pagamento_response.json()
-        
-        # Atualiza status da ordem
-        if pagamento_response["status"] == "Aprovado":
-            db_ordem.status = "Concluído"
-        else:
-            db_ordem.status = "Pagamento Recusado"
-    
-        db.commit()
-        db.refresh(db_ordem)
-        
-        return db_ordem
+        if reserva_response.status_code == 409:
+            raise HTTPException(status_code=409, detail="Livro esgotado")
+        if reserva_response.status_code != 200:
+            raise HTTPException(status_code=400, detail="Falha ao reservar o livro")
+    except HTTPException:
+        raise
+    except ServicoIndisponivel as e:
+        logger.warning("Ordem recusada: %s", e)
+        raise HTTPException(status_code=503, detail=str(e))
+    except httpx.ReadTimeout as e:
+        # A requisição chegou ao cadastro de livros, que pode ter reservado a
+        # unidade antes do timeout: libera a reserva para não perder estoque.
+        # Timeouts de conexão não chegam ao serviço e não liberam nada.
+        logger.error("Timeout ao reservar o livro %s: %s", ordem.id_livro, e)
+        await libera_reserva(http, ordem.id_livro)
+        raise HTTPException(status_code=500, detail=f"Erro ao criar ordem {str(e)}")
+    except Exception as e:
+        logger.error("Erro ao criar ordem: %s", e)
+        raise HTTPException(status_code=500, detail=f"Erro ao criar ordem {str(e)}")
+
+    try:
+        # Cria ordem de compra e o pagamento pendente
+        db_ordem = await models.cria_ordem(db=db, ordem=ordem, chave_idempotencia=idempotency_key)
+        # Copia a ordem criada: após um rollback a sessão assíncrona não recarrega os atributos
+        ordem_criada = models.Ordem.model_validate(db_ordem)
+    except IntegrityError as e:
+        await db.rollback()
+        await libera_reserva(http, ordem.id_livro)
+        # Outra requisição com a mesma chave criou a ordem primeiro
+        existente = None
+        if idempotency_key is not None:
+            existente = await models.busca_ordem_por_chave(db=db, chave_idempotencia=idempotency_key)
+        if existente is None:
+            logger.error("Erro ao criar ordem: %s", e)
+            raise HTTPException(status_code=500, detail=f"Erro ao criar ordem {str(e)}")
+        return existente
     except Exception as e:
-        logger.error(f"Erro ao criar ordem: {str(e)}")
+        logger.error("Erro ao criar ordem: %s", e)
+        await libera_reserva(http, ordem.id_livro)
         raise HTTPException(status_code=500, detail=f"Erro ao criar ordem {str(e)}")
 
+    avisa_workers()
+    response.status_code = 202
+    return ordem_criada
+
+# Define a rota para criar ordens de vários livros
+@app.post("/ordens/lote", response_model=models.OrdemLoteResultado)
+async def cria_ordens(
+    lote: models.OrdemLoteCreate,
+    response: Response,
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key", max_length=255),
+    db: AsyncSession = Depends(get_db),
+    http: httpx.AsyncClient = Depends(get_http_client),
+):
+    """
+    Rota para criar de uma vez as ordens de compra de vários livros.
+
+    Os livros são reservados com uma única chamada ao serviço de cadastro de
+    livros e as ordens e os pagamentos pendentes são gravados com um único
+    INSERT. Como em POST /ordens/, os pagamentos são publicados pelos workers
+    da fila e a rota responde 202 quando cria alguma ordem. O resultado traz
+    um item por ordem pedida, na ordem da requisição, com o id e o status da
+    ordem criada ou o motivo de ela não ter sido criada (Livro não encontrado
+    ou Livro esgotado).
+
+    Com o cabeçalho Idempotency-Key, repetir a requisição com a mesma chave
+    retorna o resultado do lote original sem chamar os outros serviços.
+    """
+    if len(lote.ordens) > MAX_ORDENS_POR_LOTE:
+        raise HTTPException(status_code=400, detail=f"Informe no máximo {MAX_ORDENS_POR_LOTE} ordens")
+
+    # Retorna o resultado do lote já criado com a mesma chave de idempotência
+    if idempotency_key is not None:
+        resultado = await models.busca_lote_por_chave(db=db, chave_idempotencia=idempotency_key)
+        if resultado is not None:
+            logger.info("Lote de ordens retornado pela chave de idempotência")
+            return {"itens": resultado}
+
+    try:
+        # Reserva as unidades de todos os livros no serviço de cadastro de livros
+        logger.info("Criando lote de %s ordens", len(lote.ordens))
+        reservados, nao_encontrados = await reserva_livros(http, dict(Counter(ordem.id_livro for ordem in lote.ordens)))
+    except ServicoIndisponivel as e:
+        logger.warning("Lote de ordens recusado: %s", e)
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error("Erro ao reservar os livros do lote: %s", e)
+        raise HTTPException(status_code=500, detail=f"Erro ao criar ordens {str(e)}")
+
+    # Distribui as unidades reservadas entre as ordens, na ordem da requisição
+    nao_encontrados = set(nao_encontrados)
+    disponiveis = dict(reservados)
+    itens = []
+    for ordem in lote.ordens:
+        if ordem.id_livro in nao_encontrados:
+            status = "Livro não encontrado"
+        elif disponiveis.get(ordem.id_livro, 0) > 0:
+            disponiveis[ordem.id_livro] -= 1
+            status = "Pendente"
+        else:
+            status = "Livro esgotado"
+        itens.append(models.OrdemLoteItem(id_livro=ordem.id_livro, status=status))
+
+    pendentes = [item for item in itens if item.status == "Pendente"]
+    if not pendentes and idempotency_key is None:
+        return {"itens": itens}
+
+    try:
+        # Cria as ordens, os pagamentos pendentes e o registro do lote
+        itens = await models.cria_ordens(db=db, itens=itens, chave_idempotencia=idempotency_key)
+    except IntegrityError as e:
+        await libera_reservas(http, reservados)
+        # Outra requisição com a mesma chave criou o lote primeiro
+        resultado = None
+        if idempotency_key is not None:
+            resultado = await models.busca_lote_por_chave(db=db, chave_idempotencia=idempotency_key)
+        if resultado is None:
+            logger.error("Erro ao criar lote de ordens: %s", e)
+            raise HTTPException(status_code=500, detail=f"Erro ao criar ordens {str(e)}")
+        return {"itens": resultado}
+    except Exception as e:
+        logger.error("Erro ao criar lote de ordens: %s", e)
+        await libera_reservas(http, reservados)
+        raise HTTPException(status_code=500, detail=f"Erro ao criar ordens {str(e)}")
+
+    if not pendentes:
+        return {"itens": itens}
+
+    avisa_workers()
+    response.status_code = 202
+    logger.info("Lote de %s ordens criado: %s ordens criadas", len(itens), len(pendentes))
+    return {"itens": itens}
+
 # Define a rota para listar ordens por id
 @app.get("/ordens/{id}", response_model=models.Ordem)
-def busca_ordem(id: int, db: Session = Depends(get_db)):
+async def busca_ordem(id: int, db: AsyncSession = Depends(get_db)):
     """
     Rota para buscar uma ordem pelo id
     """
     try:
-        logger.info(f"Buscando ordem com id: {id}")
-        ordem = models.lista_ordem(db=db, id_ordem=id)
+        logger.info("Buscando ordem com id: %s", id)
+        ordem = await models.lista_ordem(db=db, id_ordem=id)
         if ordem is None:
-            logger.warning(f"Ordem com id {id} não encontrada")
+            logger.warning("Ordem com id %s não encontrada", id)
             raise HTTPException(status_code=404, detail="Ordem não encontrada")
         return ordem
     except Exception as e:
-        logger.error(f"Erro ao buscar ordem: {e}")
+        logger.error("Erro ao buscar ordem: %s", e)
         raise HTTPException(status_code=500, detail="Erro ao buscar ordem")
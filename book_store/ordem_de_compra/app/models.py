@@ -1,9 +1,12 @@
 """
 Modulo responsável por manipular os dados do banco de dados
 """
-from sqlalchemy import Column, Integer, String
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from datetime import timedelta
+from collections import defaultdict
+from sqlalchemy import JSON, Column, DateTime, Integer, String, delete, func, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, Field
 from .databases import Base
 from . import logger
 
@@ -23,35 +26,217 @@ class Ordem(OrdemBase):
     class Config:
         from_attributes = True # Permite que a classe seja compatível com objetos ORM (Object Relational Mapping)
 
+# Classe com as ordens de compra de um pedido em lote
+class OrdemLoteCreate(BaseModel):
+    ordens: list[OrdemCreate] = Field(min_length=1)
+
+# Classe com o resultado de cada ordem de um pedido em lote
+class OrdemLoteItem(OrdemBase):
+    id: int | None = None # Identificação da ordem, quando criada
+    status: str # Status da ordem ou motivo de não ter sido criada (ex. Livro esgotado)
+
+# Classe com o resultado de um pedido em lote, na ordem da requisição
+class OrdemLoteResultado(BaseModel):
+    itens: list[OrdemLoteItem]
+
 # Define a classe OrdemDB contendo os campos para criação da tabela no banco de dados
 class OrdemDB(Base):
     __tablename__ = "ordens" # Nome da tabela no banco de dados
     id = Column(Integer, primary_key=True, index=True) # Campo de identificação da ordem
     id_livro = Column(Integer) # Campo de identificação do livro
     status = Column(String) # Campo de status da ordem
+    chave_idempotencia = Column(String, unique=True) # Valor do cabeçalho Idempotency-Key da requisição que criou a ordem
+
+# Define a classe LoteOrdemDB com o resultado de cada pedido em lote feito com Idempotency-Key
+class LoteOrdemDB(Base):
+    __tablename__ = "lotes_ordens" # Nome da tabela no banco de dados
+    id = Column(Integer, primary_key=True) # Campo de identificação do lote
+    chave_idempotencia = Column(String, unique=True, nullable=False) # Valor do cabeçalho Idempotency-Key da requisição que criou o lote
+    resultado = Column(JSON, nullable=False) # Itens retornados pela requisição original
+
+# Define a classe FilaPagamentoDB que representa a fila de pagamentos pendentes.
+# Funciona como outbox: cada item é gravado na mesma transação que cria a ordem.
+class FilaPagamentoDB(Base):
+    __tablename__ = "fila_pagamentos" # Nome da tabela no banco de dados
+    id = Column(Integer, primary_key=True) # Campo de identificação do item da fila
+    id_ordem = Column(Integer, nullable=False, index=True) # Ordem cujo pagamento deve ser enviado
+    id_livro = Column(Integer, nullable=False) # Livro reservado para a ordem
+    tentativas = Column(Integer, nullable=False, default=0) # Quantidade de envios já tentados
+    disponivel_em = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True) # Momento a partir do qual o item pode ser processado
 
 # Função que cria uma ordem no banco de dados
-def cria_ordem(db: Session, ordem: OrdemCreate):
+async def cria_ordem(db: AsyncSession, ordem: OrdemCreate, chave_idempotencia: str | None = None):
     """
-    Função que cria uma ordem no banco de dados
+    Função que cria uma ordem no banco de dados.
+
+    O pagamento da ordem é gravado na fila na mesma transação que cria a
+    ordem, então uma falha após o commit nunca deixa uma ordem Pendente sem
+    pagamento. Se `chave_idempotencia` já foi usada por outra ordem, o commit
+    falha com IntegrityError.
     """
     db_ordem = OrdemDB(
         id_livro=ordem.id_livro,
-        status="Pendente"
+        status="Pendente",
+        chave_idempotencia=chave_idempotencia,
     )
     db.add(db_ordem)
-    db.commit()
-    db.refresh(db_ordem)
+    await db.flush()
+    db.add(FilaPagamentoDB(id_ordem=db_ordem.id, id_livro=db_ordem.id_livro))
+    await db.commit()
+    await db.refresh(db_ordem)
 
     return db_ordem
 
+# Função que cria várias ordens no banco de dados
+async def cria_ordens(db: AsyncSession, itens: list[OrdemLoteItem], chave_idempotencia: str | None = None):
+    """
+    Função que cria uma ordem para cada item Pendente de `itens`, preenche o
+    id dos itens com as ordens criadas e retorna os itens.
+
+    As ordens e os seus pagamentos pendentes são gravados por um único
+    comando, um INSERT ... RETURNING com várias linhas cujo resultado alimenta
+    o INSERT na fila de pagamentos. Com `chave_idempotencia`, o resultado do
+    lote é gravado em lotes_ordens na mesma transação; se a chave já foi
+    usada por outro lote, o commit falha com IntegrityError.
+    """
+    pendentes = [item for item in itens if item.status == "Pendente"]
+    try:
+        if pendentes:
+            novas = (
+                insert(OrdemDB)
+                .values([{"id_livro": item.id_livro, "status": "Pendente"} for item in pendentes])
+                .returning(OrdemDB.id, OrdemDB.id_livro)
+                .cte("novas")
+            )
+            stmt = (
+                insert(FilaPagamentoDB)
+                .from_select(
+                    ["id_ordem", "id_livro", "tentativas"],
+                    select(novas.c.id, novas.c.id_livro, literal(0)),
+                )
+                .returning(FilaPagamentoDB.id_ordem, FilaPagamentoDB.id_livro)
+            )
+            # Associa as ordens criadas aos itens pelo id do livro
+            ordens_por_livro = defaultdict(list)
+            for id_ordem, id_livro in (await db.execute(stmt)).all():
+                ordens_por_livro[id_livro].append(id_ordem)
+            for item in pendentes:
+                item.id = ordens_por_livro[item.id_livro].pop()
+        if chave_idempotencia is not None:
+            db.add(LoteOrdemDB(chave_idempotencia=chave_idempotencia, resultado=[item.model_dump() for item in itens]))
+        await db.commit()
+        return itens
+    except IntegrityError:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        logger.error("Erro ao criar %s ordens: %s", len(pendentes), e)
+        raise
+
 # Função que retorna ordem do banco de dados
-def lista_ordem(db: Session, id_ordem: int):
+async def lista_ordem(db: AsyncSession, id_ordem: int):
     """
     Função que retorna uma ordem do banco de dados
     """
     try:
-        return db.query(OrdemDB).filter(OrdemDB.id == id_ordem).first()
+        return await db.scalar(select(OrdemDB).where(OrdemDB.id == id_ordem))
+    except Exception as e:
+        logger.error("Erro ao buscar ordem com id %s: %s", id_ordem, e)
+        raise
+
+# Função que retorna a ordem criada com uma chave de idempotência
+async def busca_ordem_por_chave(db: AsyncSession, chave_idempotencia: str):
+    """
+    Função que retorna a ordem criada com a chave de idempotência informada
+    """
+    try:
+        return await db.scalar(select(OrdemDB).where(OrdemDB.chave_idempotencia == chave_idempotencia))
+    except Exception as e:
+        logger.error("Erro ao buscar ordem com chave de idempotência %s: %s", chave_idempotencia, e)
+        raise
+
+# Função que retorna o resultado do lote criado com uma chave de idempotência
+async def busca_lote_por_chave(db: AsyncSession, chave_idempotencia: str):
+    """
+    Função que retorna os itens do lote criado com a chave de idempotência
+    informada, ou None se a chave não foi usada
+    """
+    try:
+        return await db.scalar(select(LoteOrdemDB.resultado).where(LoteOrdemDB.chave_idempotencia == chave_idempotencia))
+    except Exception as e:
+        logger.error("Erro ao buscar lote com chave de idempotência %s: %s", chave_idempotencia, e)
+        raise
+
+# Função que reserva um lote de pagamentos da fila para processamento
+async def reserva_pagamentos(db: AsyncSession, limite: int, lease: float):
+    """
+    Função que reserva até `limite` pagamentos disponíveis na fila.
+
+    Usa SELECT ... FOR UPDATE SKIP LOCKED, então vários workers, inclusive em
+    processos diferentes, nunca reservam o mesmo item. O item fica invisível
+    por `lease` segundos; se o worker falhar antes de concluí-lo, ele volta
+    para a fila automaticamente.
+    """
+    try:
+        disponiveis = (
+            select(FilaPagamentoDB.id)
+            .where(FilaPagamentoDB.disponivel_em <= func.now())
+            .order_by(FilaPagamentoDB.id)
+            .limit(limite)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        stmt = (
+            update(FilaPagamentoDB)
+            .where(FilaPagamentoDB.id.in_(disponiveis))
+            .values(
+                disponivel_em=func.now() + timedelta(seconds=lease),
+                tentativas=FilaPagamentoDB.tentativas + 1,
+            )
+            .returning(FilaPagamentoDB.id, FilaPagamentoDB.id_ordem, FilaPagamentoDB.id_livro, FilaPagamentoDB.tentativas)
+        )
+        itens = (await db.execute(stmt)).all()
+        await db.commit()
+        return itens
+    except Exception as e:
+        await db.rollback()
+        logger.error("Erro ao reservar pagamentos da fila: %s", e)
+        raise
+
+# Função que devolve à fila pagamentos reservados que não foram enviados
+async def devolve_pagamentos(db: AsyncSession, id_itens: list[int]):
+    """
+    Função que desfaz a reserva dos itens da fila: desconta a tentativa e
+    torna os itens disponíveis novamente.
+
+    Usada quando a chamada ao serviço de pagamento foi recusada antes de ser
+    feita, então a tentativa não conta para PAGAMENTO_MAX_TENTATIVAS.
+    """
+    try:
+        await db.execute(
+            update(FilaPagamentoDB)
+            .where(FilaPagamentoDB.id.in_(id_itens))
+            .values(disponivel_em=func.now(), tentativas=FilaPagamentoDB.tentativas - 1)
+        )
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        logger.error("Erro ao devolver pagamentos à fila: %s", e)
+        raise
+
+# Função que conclui pagamentos processados
+async def conclui_pagamentos(db: AsyncSession, status_por_ordem: dict[int, str]):
+    """
+    Função que atualiza o status das ordens e remove os itens da fila.
+
+    Recebe {id da ordem: status} e grava tudo em uma única transação.
+    """
+    try:
+        await db.execute(update(OrdemDB), [{"id": id_ordem, "status": status} for id_ordem, status in status_por_ordem.items()])
+        await db.execute(delete(FilaPagamentoDB).where(FilaPagamentoDB.id_ordem.in_(list(status_por_ordem))))
+        await db.commit()
     except Exception as e:
-        logger.error(f"Erro ao buscar ordem com id {id_ordem}: {e}")
+        await db.rollback()
+        logger.error("Erro ao concluir pagamentos da fila: %s", e)
         raise
@@ -0,0 +1,250 @@
+"""
+Módulo com a proteção das chamadas aos outros serviços: circuit breaker e
+limite de concorrência adaptativo (AIMD) por serviço
+"""
+import asyncio
+import os
+import time
+from opentelemetry import metrics, trace
+from opentelemetry.metrics import Observation
+
+# Cria o medidor das métricas das dependências
+meter = metrics.get_meter(__name__)
+
+# Define a exceção das chamadas recusadas sem acessar o serviço
+class ServicoIndisponivel(Exception):
+    """
+    A chamada foi recusada porque o circuito está aberto ou o limite de
+    chamadas simultâneas ao serviço foi atingido.
+    """
+
+# Define o circuit breaker de um serviço
+class Circuito:
+    """
+    Circuit breaker com os estados fechado, aberto e meio_aberto.
+
+    Fechado, todas as chamadas passam. Após `falhas` falhas seguidas o
+    circuito abre e recusa as chamadas por `tempo_aberto` segundos. Depois
+    disso fica meio_aberto e deixa passar uma única chamada de teste: se ela
+    funcionar o circuito fecha, senão abre novamente.
+    """
+    FECHADO = "fechado"
+    MEIO_ABERTO = "meio_aberto"
+    ABERTO = "aberto"
+
+    def __init__(self, falhas: int, tempo_aberto: float):
+        self.falhas = falhas
+        self.tempo_aberto = tempo_aberto
+        self.estado = self.FECHADO
+        self._falhas_seguidas = 0
+        self._aberto_ate = 0.0
+        self._teste_em_andamento = False
+
+    def recusa(self):
+        """
+        Retorna se o circuito recusaria uma chamada agora, sem alterar o
+        estado: aberto, ou meio_aberto com a chamada de teste em andamento.
+        """
+        if self.estado == self.ABERTO:
+            return time.monotonic() < self._aberto_ate
+        return self.estado == self.MEIO_ABERTO and self._teste_em_andamento
+
+    def permite(self):
+        """
+        Retorna se a chamada pode ser feita, passando de aberto para
+        meio_aberto quando o tempo aberto termina.
+        """
+        if self.estado == self.ABERTO:
+            if time.monotonic() < self._aberto_ate:
+                return False
+            self.estado = self.MEIO_ABERTO
+        if self.estado == self.MEIO_ABERTO:
+            if self._teste_em_andamento:
+                return False
+            self._teste_em_andamento = True
+        return True
+
+    def registra(self, sucesso: bool):
+        """
+        Registra o resultado de uma chamada.
+        """
+        if sucesso:
+            self._falhas_seguidas = 0
+            self._teste_em_andamento = False
+            self.estado = self.FECHADO
+            return
+        if self.estado == self.ABERTO:
+            # Chamada iniciada antes da abertura: não prolonga o tempo aberto
+            return
+        self._falhas_seguidas += 1
+        if self.estado == self.MEIO_ABERTO or self._falhas_seguidas >= self.falhas:
+            self._teste_em_andamento = False
+            self.estado = self.ABERTO
+            self._aberto_ate = time.monotonic() + self.tempo_aberto
+
+    def cancela(self):
+        """
+        Registra uma chamada cancelada, que não conta como sucesso nem como
+        falha, mas libera a chamada de teste do estado meio_aberto.
+        """
+        self._teste_em_andamento = False
+
+# Define o limite de chamadas simultâneas com aumento aditivo e redução multiplicativa
+class LimiteAIMD:
+    """
+    Limite de chamadas simultâneas ajustado pelo resultado de cada chamada.
+
+    Uma chamada com sucesso e latência até `latencia_alvo_ms` aumenta o
+    limite em 1, desde que pelo menos metade dele esteja em uso. Uma falha
+    ou uma chamada mais lenta que o alvo multiplica o limite por `reducao`.
+    O limite fica entre `minimo` e `maximo`.
+    """
+    def __init__(self, inicial: int, minimo: int, maximo: int, latencia_alvo_ms: float, reducao: float = 0.9):
+        self.limite = float(inicial)
+        self.minimo = minimo
+        self.maximo = maximo
+        self.latencia_alvo_ms = latencia_alvo_ms
+        self.reducao = reducao
+        self.em_uso = 0
+
+    def disponivel(self):
+        return self.em_uso < int(self.limite)
+
+    def registra(self, sucesso: bool, latencia_ms: float):
+        """
+        Registra o resultado de uma chamada e ajusta o limite.
+        """
+        if not sucesso or latencia_ms > self.latencia_alvo_ms:
+            self.limite = max(self.minimo, self.limite * self.reducao)
+        elif self.em_uso * 2 >= self.limite:
+            self.limite = min(self.maximo, self.limite + 1)
+
+# Define um serviço chamado por este serviço
+class Dependencia:
+    """
+    Protege as chamadas a um serviço com um Circuito e um LimiteAIMD.
+
+    A configuração vem das variáveis de ambiente com o `prefixo` do serviço
+    (ex. PAYMENT_TIMEOUT, PAYMENT_CIRCUITO_FALHAS). Uma chamada recusada pelo
+    circuito ou pelo limite levanta ServicoIndisponivel na hora, sem esperar
+    o serviço. Exceções e respostas 5xx contam como falha; uma chamada
+    cancelada (ex. o cliente desconectou) não conta.
+
+    As rotas e os workers da fila rodam no mesmo event loop e o estado só é
+    alterado entre os awaits, então não há lock. O estado é registrado como
+    atributos do span atual e nas métricas bookstore.dependencia.*, com o
+    atributo `dependencia`.
+    """
+    def __init__(self, nome: str, prefixo: str, timeout: float, latencia_alvo_ms: float):
+        self.nome = nome
+        self.timeout = float(os.getenv(f"{prefixo}_TIMEOUT", str(timeout)))
+        self.circuito = Circuito(
+            falhas=int(os.getenv(f"{prefixo}_CIRCUITO_FALHAS", "5")),
+            tempo_aberto=float(os.getenv(f"{prefixo}_CIRCUITO_ABERTO", "10")),
+        )
+        self.limite = LimiteAIMD(
+            inicial=int(os.getenv(f"{prefixo}_LIMITE_INICIAL", "20")),
+            minimo=int(os.getenv(f"{prefixo}_LIMITE_MINIMO", "1")),
+            maximo=int(os.getenv(f"{prefixo}_LIMITE_MAXIMO", "200")),
+            latencia_alvo_ms=float(os.getenv(f"{prefixo}_LATENCIA_ALVO_MS", str(latencia_alvo_ms))),
+        )
+
+    def disponivel(self):
+        """
+        Retorna se uma chamada seria aceita agora pelo circuito e pelo limite,
+        sem alterar o estado.
+        """
+        return self.limite.disponivel() and not self.circuito.recusa()
+
+    async def chama(self, funcao):
+        """
+        Aguarda `funcao(timeout)`, que faz a requisição ao serviço, e retorna a resposta.
+        """
+        if not self.limite.disponivel():
+            motivo = "limite"
+        elif not self.circuito.permite():
+            motivo = "circuito_aberto"
+        else:
+            motivo = None
+            self.limite.em_uso += 1
+        self._registra_span()
+        if motivo is not None:
+            dependencia_rejeicoes.add(1, {"dependencia": self.nome, "motivo": motivo})
+            raise ServicoIndisponivel(f"Serviço {self.nome} indisponível ({motivo})")
+
+        sucesso = False
+        cancelada = False
+        inicio = time.perf_counter()
+        try:
+            resposta = await funcao(self.timeout)
+            sucesso = resposta.status_code < 500
+            return resposta
+        except asyncio.CancelledError:
+            cancelada = True
+            raise
+        finally:
+            if cancelada:
+                self.circuito.cancela()
+            else:
+                self.limite.registra(sucesso, (time.perf_counter() - inicio) * 1000)
+                self.circuito.registra(sucesso)
+            self.limite.em_uso -= 1
+
+    def _registra_span(self):
+        trace.get_current_span().set_attributes({
+            f"dependencia.{self.nome}.circuito": self.circuito.estado,
+            f"dependencia.{self.nome}.limite": int(self.limite.limite),
+            f"dependencia.{self.nome}.em_uso": self.limite.em_uso,
+        })
+
+# Serviços chamados pela ordem de compra
+cadastro_de_livros = Dependencia("cadastro_de_livros", prefixo="BOOK", timeout=2, latencia_alvo_ms=500)
+pagamento = Dependencia("pagamento", prefixo="PAYMENT", timeout=5, latencia_alvo_ms=1000)
+dependencias = (cadastro_de_livros, pagamento)
+
+# Valor da métrica de cada estado do circuito
+_ESTADOS_CIRCUITO = {Circuito.FECHADO: 0, Circuito.MEIO_ABERTO: 1, Circuito.ABERTO: 2}
+
+# Funções de callback que leem o estado das dependências
+def observa_circuito(options):
+    for dependencia in dependencias:
+        yield Observation(_ESTADOS_CIRCUITO[dependencia.circuito.estado], {"dependencia": dependencia.nome})
+
+def observa_limite(options):
+    for dependencia in dependencias:
+        yield Observation(int(dependencia.limite.limite), {"dependencia": dependencia.nome})
+
+def observa_em_uso(options):
+    for dependencia in dependencias:
+        yield Observation(dependencia.limite.em_uso, {"dependencia": dependencia.nome})
+
+"""
+Definição das métricas das dependências
+"""
+
+dependencia_rejeicoes = meter.create_counter(
+    name="bookstore.dependencia.rejeicoes",
+    description="Chamadas recusadas sem acessar o serviço, pelos atributos dependencia e motivo",
+    unit="number",
+)
+
+dependencia_circuito = meter.create_observable_gauge(
+    name="bookstore.dependencia.circuito",
+    callbacks=[observa_circuito],
+    description="Estado do circuito de cada dependência: 0 fechado, 1 meio_aberto, 2 aberto",
+    unit="number",
+)
+
+dependencia_limite = meter.create_observable_gauge(
+    name="bookstore.dependencia.limite",
+    callbacks=[observa_limite],
+    description="Limite atual de chamadas simultâneas a cada dependência",
+    unit="number",
+)
+
+dependencia_em_uso = meter.create_observable_gauge(
+    name="bookstore.dependencia.em_uso",
+    callbacks=[observa_em_uso],
+    description="Chamadas em andamento a cada dependência",
+    unit="number",
+)
@@ -0,0 +1,81 @@
+"""
+Módulo responsável pelas chamadas aos serviços de cadastro de livros e pagamento
+"""
+import asyncio
+import os
+import httpx
+from .assinatura import assina_ordem
+from .resiliencia import cadastro_de_livros, pagamento
+from . import logger
+
+# Obtém url dos serviços pagamento e cadastro de livros
+PAYMENT_URL = os.getenv("PAYMENT_URL", "http://pagamento:8082")
+BOOK_URL = os.getenv("BOOK_URL", "http://cadastro_de_livros:8080")
+
+# Reserva unidades de um livro no serviço de cadastro de livros
+async def reserva_livro(http: httpx.AsyncClient, id_livro: int, quantidade: int = 1):
+    """
+    Reserva unidades do livro e retorna a resposta do serviço de cadastro de livros
+    """
+    return await cadastro_de_livros.chama(
+        lambda timeout: http.post(f"{BOOK_URL}/livros/{id_livro}/reservas", json={"quantidade": quantidade}, timeout=timeout)
+    )
+
+# Reserva unidades de vários livros no serviço de cadastro de livros
+async def reserva_livros(http: httpx.AsyncClient, quantidades: dict[int, int]):
+    """
+    Reserva os livros em uma única chamada e retorna ({id do livro: quantidade
+    reservada}, ids não encontrados). A quantidade reservada pode ser menor
+    que a pedida quando o estoque não é suficiente.
+    """
+    reserva_response = await cadastro_de_livros.chama(
+        lambda timeout: http.post(f"{BOOK_URL}/livros/reservas", json={"quantidades": quantidades}, timeout=timeout)
+    )
+    if reserva_response.status_code != 200:
+        raise RuntimeError(f"Falha ao reservar os livros (status {reserva_response.status_code})")
+
+    resultado = reserva_response.json()
+    reservados = {int(id_livro): quantidade for id_livro, quantidade in resultado["reservados"].items()}
+    return reservados, resultado["nao_encontrados"]
+
+# Devolve ao estoque a unidade reservada para uma ordem que não foi concluída
+async def libera_reserva(http: httpx.AsyncClient, id_livro: int, quantidade: int = 1):
+    """
+    Libera a reserva de unidades do livro no serviço de cadastro de livros
+    """
+    try:
+        await cadastro_de_livros.chama(
+            lambda timeout: http.delete(
+                f"{BOOK_URL}/livros/{id_livro}/reservas", params={"quantidade": quantidade}, timeout=timeout
+            )
+        )
+    except Exception as e:
+        logger.error("Erro ao liberar reserva do livro %s: %s", id_livro, e)
+
+# Devolve ao estoque as unidades reservadas de vários livros
+async def libera_reservas(http: httpx.AsyncClient, quantidades: dict[int, int]):
+    """
+    Libera as reservas em paralelo, uma chamada por livro
+    """
+    await asyncio.gather(
+        *(libera_reserva(http, id_livro, quantidade) for id_livro, quantidade in quantidades.items() if quantidade > 0)
+    )
+
+# Envia os pagamentos de várias ordens para o serviço de pagamento
+async def envia_pagamentos(http: httpx.AsyncClient, id_ordens: list[int]):
+    """
+    Envia os pagamentos em uma única chamada e retorna {id da ordem: status da ordem}.
+
+    Ordens não encontradas pelo serviço de pagamento ficam fora do resultado.
+    """
+    tokens = {id_ordem: assina_ordem(id_ordem) for id_ordem in id_ordens}
+    pagamento_response = await pagamento.chama(
+        lambda timeout: http.post(f"{PAYMENT_URL}/pagamentos/lote", json={"id_ordens": id_ordens, "tokens": tokens}, timeout=timeout)
+    )
+    if pagamento_response.status_code != 200:
+        raise RuntimeError(f"Falha no processamento dos pagamentos (status {pagamento_response.status_code})")
+
+    return {
+        pagamento["id_ordem"]: "Concluído" if pagamento["status"] == "Aprovado" else "Pagamento Recusado"
+        for pagamento in pagamento_response.json()["pagamentos"]
+    }
@@ -0,0 +1,22 @@
+"""
+Módulo responsável por verificar a assinatura das ordens recebidas do serviço de ordem de compra
+"""
+import hashlib
+import hmac
+import os
+
+# Obtém o segredo compartilhado com o serviço de ordem de compra
+ORDEM_TOKEN_SEGREDO = os.getenv("ORDEM_TOKEN_SEGREDO")
+
+# Verifica o token que comprova que a ordem foi criada pelo serviço de ordem de compra
+def verifica_ordem(id_ordem: int, token: str | None):
+    """
+    Retorna True se o token for o HMAC-SHA256 do id da ordem.
+
+    Sem segredo configurado ou sem token retorna False, e a ordem deve ser
+    validada com uma chamada ao serviço de ordem de compra.
+    """
+    if not ORDEM_TOKEN_SEGREDO or not token:
+        return False
+    esperado = hmac.new(ORDEM_TOKEN_SEGREDO.encode(), str(id_ordem).encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(esperado, token)
@@ -0,0 +1,128 @@
+"""
+Módulo responsável por preparar o banco de dados e medir a inicialização do serviço.
+
+A preparação cria o banco de dados e as tabelas que não existirem e
+adiciona às tabelas já existentes as colunas e os índices criados depois
+delas, então um banco de uma versão anterior é atualizado sem passos
+manuais. Ela é executada uma única vez antes de subir os workers (no
+docker-compose, pelo serviço de migração):
+
+    python -m app.inicializacao
+
+Os workers só preparam o banco na inicialização com
+DB_MIGRACAO_NA_INICIALIZACAO=true.
+"""
+import os
+import time
+from opentelemetry import metrics
+from sqlalchemy import inspect, text
+from sqlalchemy_utils import database_exists
+from . import models
+from .databases import engine, initialize_database
+from . import logger
+
+# Marca o início da inicialização do processo
+INICIO = time.perf_counter()
+
+# Obtém a configuração da preparação do banco de dados das variáveis de ambiente
+DB_MIGRACAO_NA_INICIALIZACAO = os.getenv("DB_MIGRACAO_NA_INICIALIZACAO", "false").lower() == "true"
+
+# Identificador do advisory lock que serializa a preparação entre os workers
+ADVISORY_LOCK_MIGRACAO = 7_000_001
+
+# Colunas adicionadas depois da criação das tabelas, com DDL idempotente
+ALTERACOES = [
+    "ALTER TABLE pagamentos ADD COLUMN IF NOT EXISTS chave_idempotencia VARCHAR UNIQUE",
+]
+
+# Cria a métrica do tempo de inicialização do serviço
+duracao_inicializacao = metrics.get_meter(__name__).create_histogram(
+    name="bookstore.inicializacao.duracao",
+    description="Tempo entre o carregamento da aplicação e o início do atendimento",
+    unit="ms",
+)
+
+# Verifica se o banco de dados já está preparado
+def esquema_existe():
+    """
+    Retorna se o banco de dados existe e já tem todas as tabelas, colunas e
+    índices dos modelos, sem executar DDL. Um banco de uma versão anterior,
+    sem as colunas ou os índices novos, não está preparado.
+    """
+    if not database_exists(engine.url):
+        return False
+    with engine.connect() as conexao:
+        inspetor = inspect(conexao)
+        tabelas = set(inspetor.get_table_names())
+        for tabela in models.Base.metadata.sorted_tables:
+            if tabela.name not in tabelas:
+                return False
+            colunas = {coluna["name"] for coluna in inspetor.get_columns(tabela.name)}
+            if not colunas >= set(tabela.columns.keys()):
+                return False
+            indices = {indice["name"]: bool(indice["unique"]) for indice in inspetor.get_indexes(tabela.name)}
+            if any(indices.get(indice.name) != bool(indice.unique) for indice in tabela.indexes):
+                return False
+    return True
+
+# Atualiza as tabelas que já existiam antes das colunas e índices novos
+def atualiza_tabelas(conexao):
+    """
+    Executa as ALTERACOES e cria os índices que faltam, recriando os índices
+    que passaram a ser únicos. O create_all não altera tabelas existentes.
+    """
+    for alteracao in ALTERACOES:
+        conexao.execute(text(alteracao))
+    inspetor = inspect(conexao)
+    for tabela in models.Base.metadata.sorted_tables:
+        existentes = {indice["name"]: indice["unique"] for indice in inspetor.get_indexes(tabela.name)}
+        for indice in tabela.indexes:
+            if indice.name in existentes and bool(existentes[indice.name]) != bool(indice.unique):
+                logger.info("Recriando o índice %s", indice.name)
+                indice.drop(conexao)
+            indice.create(conexao, checkfirst=True)
+
+# Prepara o banco de dados e as tabelas
+def migra():
+    """
+    Cria o banco de dados e as tabelas que não existirem e atualiza as
+    tabelas existentes com atualiza_tabelas.
+
+    A criação das tabelas acontece com um advisory lock do Postgres, então
+    vários workers iniciando ao mesmo tempo executam o DDL um de cada vez.
+    Quando o esquema já está completo, retorna sem pegar o lock.
+    """
+    if esquema_existe():
+        logger.info("Banco de dados já preparado")
+        return
+
+    if not database_exists(engine.url):
+        try:
+            initialize_database()
+        except Exception:
+            # Outro worker pode ter criado o banco de dados ao mesmo tempo
+            if not database_exists(engine.url):
+                raise
+
+    with engine.begin() as conexao:
+        conexao.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_MIGRACAO})
+        models.Base.metadata.create_all(bind=conexao)
+        atualiza_tabelas(conexao)
+    logger.info("Banco de dados preparado")
+
+# Executa as tarefas de inicialização do processo
+def inicializa():
+    """
+    Prepara o banco de dados, se habilitado, e registra o tempo de inicialização.
+
+    É síncrona: o lifespan a executa com run_in_threadpool para não bloquear
+    o event loop.
+    """
+    if DB_MIGRACAO_NA_INICIALIZACAO:
+        migra()
+    duracao = (time.perf_counter() - INICIO) * 1000
+    duracao_inicializacao.record(duracao)
+    logger.info("Serviço pronto em %.0f ms", duracao)
+
+if __name__ == "__main__":
+    migra()
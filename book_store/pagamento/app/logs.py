@@ -0,0 +1,177 @@
+"""
+Módulo responsável pela configuração dos logs do serviço
+"""
+import atexit
+import logging
+import os
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+import orjson
+from opentelemetry import context, metrics, trace
+from opentelemetry.metrics import Observation
+
+# Obtém a configuração dos logs das variáveis de ambiente
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILA_TAMANHO = int(os.getenv("LOG_FILA_TAMANHO", "10000"))
+LOG_FORMATO = os.getenv("LOG_FORMATO", "json").lower()
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "unknown_service")
+
+# Define a mensagem que só é formatada quando o registro é emitido
+class MensagemCampos:
+    """
+    Mensagem com argumentos no estilo %s e campos nomeados.
+
+    O logging chama str() somente ao emitir o registro, então a formatação
+    dos argumentos e dos campos não acontece quando o nível está desabilitado.
+    """
+    __slots__ = ("msg", "args", "campos")
+
+    def __init__(self, msg, args, campos):
+        self.msg = msg
+        self.args = args
+        self.campos = campos
+
+    def mensagem(self):
+        """
+        Retorna a mensagem sem os campos.
+        """
+        return self.msg % self.args if self.args else self.msg
+
+    def __str__(self):
+        return self.mensagem() + " " + " ".join(f"{chave}={valor}" for chave, valor in self.campos.items())
+
+# Define o logger estruturado do serviço
+class LoggerEstruturado(logging.LoggerAdapter):
+    """
+    Logger que adia a formatação da mensagem até o registro ser emitido.
+
+    Use argumentos no estilo %s em vez de f-strings, e passe os campos
+    nomeados em `extra={"campos": {...}}`:
+
+        logger.info("Buscando livro com id: %s", id)
+        logger.info("Livro criado com sucesso", extra={"campos": {"id": livro.id, "titulo": livro.titulo}})
+
+    Os campos ficam separados dos argumentos do logging, então qualquer nome
+    de campo é aceito (inclusive level ou msg). Com o nível desabilitado a
+    chamada retorna antes de montar o registro. Os campos são adicionados ao
+    fim da mensagem (chave=valor) e ficam disponíveis no registro em `campos`.
+    """
+    def __init__(self, logger):
+        super().__init__(logger, None)
+
+    def log(self, level, msg, *args, **kwargs):
+        if not self.logger.isEnabledFor(level):
+            return
+        campos = (kwargs.get("extra") or {}).get("campos")
+        if campos:
+            msg, args = MensagemCampos(msg, args, campos), ()
+        # Aponta o registro para quem chamou o logger, e não para este método
+        kwargs.setdefault("stacklevel", 2)
+        self.logger.log(level, msg, *args, **kwargs)
+
+# Define o handler que envia os registros para a fila de logs
+class FilaLogHandler(QueueHandler):
+    """
+    QueueHandler com fila limitada que descarta o registro quando a fila está cheia.
+
+    A thread que chama o logger só guarda o contexto do OpenTelemetry no
+    registro; a formatação da mensagem e a escrita ficam com a thread do
+    FilaLogListener, então nem a formatação nem um destino lento atrasam uma
+    requisição. Como a mensagem é formatada depois, os argumentos não devem
+    ser alterados após a chamada ao logger. A quantidade de registros
+    descartados fica em `descartados`.
+    """
+    def __init__(self, tamanho: int):
+        super().__init__(queue.Queue(maxsize=tamanho))
+        self.descartados = 0
+
+    def prepare(self, record):
+        # A fila é do próprio processo, então o registro segue sem cópia e sem
+        # formatação: a mensagem é montada pelos handlers do FilaLogListener
+        record.contexto_otel = context.get_current()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+# Define o listener que repassa os registros da fila para os handlers
+class FilaLogListener(QueueListener):
+    """
+    QueueListener que restaura o contexto do OpenTelemetry de cada registro
+    antes de repassá-lo aos handlers, mantendo a correlação com o trace.
+    """
+    def handle(self, record):
+        # Remove o contexto do registro, pois ele não é um atributo de log válido
+        contexto = record.__dict__.pop("contexto_otel", None)
+        token = context.attach(contexto) if contexto is not None else None
+        try:
+            super().handle(record)
+        finally:
+            if token is not None:
+                context.detach(token)
+
+# Define o formatador que escreve cada registro como uma linha JSON
+class FormatadorJson(logging.Formatter):
+    """
+    Formata o registro como um objeto JSON em uma única linha, com os campos
+    timestamp, level, logger, message, service.name, trace_id e span_id, além
+    dos campos nomeados do LoggerEstruturado.
+
+    trace_id e span_id vêm do span ativo e só aparecem quando há um span
+    válido; o FilaLogListener restaura o contexto de quem chamou o logger antes
+    de formatar. A serialização usa orjson, e valores que não são JSON (ex.
+    modelos pydantic) são convertidos com str().
+    """
+    def __init__(self, service_name: str = SERVICE_NAME):
+        super().__init__()
+        self.service_name = service_name
+
+    def format(self, record):
+        dados = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.msg.mensagem() if isinstance(record.msg, MensagemCampos) else record.getMessage(),
+            "service.name": self.service_name,
+        }
+        span_context = trace.get_current_span().get_span_context()
+        if span_context.is_valid:
+            dados["trace_id"] = format(span_context.trace_id, "032x")
+            dados["span_id"] = format(span_context.span_id, "016x")
+        if record.exc_info:
+            dados["exception"] = self.formatException(record.exc_info)
+        # Os campos nomeados não sobrescrevem os campos do registro
+        for chave, valor in getattr(record, "campos", {}).items():
+            dados.setdefault(chave, valor)
+        return orjson.dumps(dados, default=str).decode()
+
+# Configura o handler que escreve os logs no terminal
+console = logging.StreamHandler()
+if LOG_FORMATO == "json":
+    console.setFormatter(FormatadorJson())
+else:
+    console.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+
+# Configuração global de logging: os registros passam pela fila antes do terminal
+fila_handler = FilaLogHandler(LOG_FILA_TAMANHO)
+listener = FilaLogListener(fila_handler.queue, console)
+listener.start()
+atexit.register(listener.stop)
+logging.basicConfig(level=LOG_LEVEL, handlers=[fila_handler])
+logger = LoggerEstruturado(logging.getLogger(__package__))
+
+# Função de callback que lê a quantidade de registros descartados
+def observa_logs_descartados(options):
+    yield Observation(fila_handler.descartados)
+
+# Define a métrica de registros de log descartados por fila cheia
+logs_descartados = metrics.get_meter(__name__).create_observable_counter(
+    name="bookstore.logs.descartados",
+    callbacks=[observa_logs_descartados],
+    description="Registros de log descartados porque a fila de logs estava cheia",
+    unit="number",
+)
@@ -1,50 +1,128 @@
-from fastapi import FastAPI, HTTPException, Depends
-from sqlalchemy.orm import Session
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 import random
-import requests
+import httpx
 import os
 from . import models
-from .databases import engine, get_db
+from .databases import get_db
+from .assinatura import verifica_ordem
+from .http_client import cria_http_client, get_http_client
+from .inicializacao import inicializa
 from . import logger
 
 # Obtém url dos serviços ordem de compra
 ORDER_URL = os.getenv("ORDER_URL", "http://ordem_de_compra:8081")
 
-# Cria as tabelas no banco de dados
-models.Base.metadata.create_all(bind=engine)
+# Obtém o timeout em segundos das chamadas ao serviço de ordem de compra
+ORDER_TIMEOUT = float(os.getenv("ORDER_TIMEOUT", "2"))
+
+# Prepara o banco de dados, cria e encerra o cliente HTTP compartilhado junto com a aplicação
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(inicializa)
+    app.state.http_client = cria_http_client()
+    yield
+    await app.state.http_client.aclose()
 
 # Cria a aplicação FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Valida se uma ordem de compra existe
+async def ordem_existe(http: httpx.AsyncClient, id_ordem: int, token: str | None):
+    """
+    Retorna True se a ordem existe.
+
+    Uma ordem assinada pelo serviço de ordem de compra é validada localmente.
+    Sem assinatura válida a ordem é consultada em GET /ordens/{id}.
+    """
+    if verifica_ordem(id_ordem, token):
+        return True
+    if token:
+        logger.warning("Assinatura inválida para a ordem %s, consultando o serviço de ordem de compra", id_ordem)
+    ordem_response = await http.get(f"{ORDER_URL}/ordens/{id_ordem}", timeout=ORDER_TIMEOUT)
+    return ordem_response.status_code == 200
 
 # Define a rota para processar pagamento
 @app.post("/pagamentos", response_model=models.Pagamento)
-def processar_pagamento(pagamento: models.PagamentoCreate, db: Session = Depends(get_db)):
+async def processar_pagamento(
+    pagamento: models.PagamentoCreate,
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key", max_length=255),
+    db: AsyncSession = Depends(get_db),
+    http: httpx.AsyncClient = Depends(get_http_client),
+):
     """
-    Processa um pagamento para a ordem especificada
+    Processa um pagamento para a ordem especificada.
+
+    Com o cabeçalho Idempotency-Key, repetir a requisição com a mesma chave
+    retorna o pagamento já criado sem consultar o serviço de ordem de compra.
     """
     try:
-        # Valida se a ordem de compra existe
-        ordem_response = requests.get(f"{ORDER_URL}/ordens/{pagamento.id_ordem}")
-        if ordem_response.status_code != 200:
+        # Retorna o pagamento já criado com a mesma chave de idempotência
+        if idempotency_key is not None:
+            db_pagamento = await models.busca_pagamento_por_chave(db=db, chave_idempotencia=idempotency_key)
+            if db_pagamento is not None:
+                logger.info("Pagamento %s retornado pela chave de idempotência", db_pagamento.id)
+                return db_pagamento
+
+        # Valida se a ordem de compra existe: pela assinatura ou, sem ela, consultando o serviço de ordem de compra
+        if not await ordem_existe(http, pagamento.id_ordem, pagamento.token):
             raise HTTPException(status_code=404, detail="Ordem de compra não encontrada")
         
         # Processa pagamento
         status = random.choice(["Aprovado", "Recusado"])
         
         # Cria o pagamento no banco
-        db_pagamento = models.processar_pagamento(db=db, pagamento=pagamento, status=status)
+        db_pagamento = await models.processar_pagamento(
+            db=db, pagamento=pagamento, status=status, chave_idempotencia=idempotency_key
+        )
         
         return db_pagamento
     except Exception as e:
-        logger.error(f"Erro ao processar pagamento: {str(e)}")
+        logger.error("Erro ao processar pagamento: %s", e)
         raise HTTPException(status_code=500, detail=f"Erro ao processar pagamento: {str(e)}")
 
+# Define a rota para processar o pagamento de várias ordens
+@app.post("/pagamentos/lote", response_model=models.PagamentoLoteResultado)
+async def processar_pagamentos(
+    lote: models.PagamentoLote,
+    db: AsyncSession = Depends(get_db),
+    http: httpx.AsyncClient = Depends(get_http_client),
+):
+    """
+    Processa os pagamentos de várias ordens em uma única transação.
+
+    Reenviar uma ordem já paga retorna o pagamento existente.
+    """
+    try:
+        # Valida as ordens de compra em paralelo
+        id_ordens = list(dict.fromkeys(lote.id_ordens))
+        existem = await asyncio.gather(
+            *(ordem_existe(http, id_ordem, lote.tokens.get(id_ordem)) for id_ordem in id_ordens)
+        )
+        encontradas = [id_ordem for id_ordem, existe in zip(id_ordens, existem) if existe]
+        nao_encontradas = [id_ordem for id_ordem in id_ordens if id_ordem not in encontradas]
+
+        # Processa os pagamentos e cria todos no banco
+        pagamentos = []
+        if encontradas:
+            status_por_ordem = {id_ordem: random.choice(["Aprovado", "Recusado"]) for id_ordem in encontradas}
+            pagamentos = await models.processar_pagamentos(db=db, status_por_ordem=status_por_ordem)
+        logger.info("Lote de pagamentos processado: %s pagamentos, %s ordens não encontradas", len(pagamentos), len(nao_encontradas))
+
+        return {"pagamentos": pagamentos, "nao_encontradas": nao_encontradas}
+    except Exception as e:
+        logger.error("Erro ao processar lote de pagamentos: %s", e)
+        raise HTTPException(status_code=500, detail=f"Erro ao processar lote de pagamentos: {str(e)}")
+
 @app.get("/pagamentos/{id_pagamento}", response_model=models.Pagamento)
-def lista_pagamentos(id_pagamento: int, db: Session = Depends(get_db)):
+async def lista_pagamentos(id_pagamento: int, db: AsyncSession = Depends(get_db)):
     """
     Retorna informações de um pagamento pelo ID
     """
-    db_pagamento = models.lista_pagamentos(db=db, id_pagamento=id_pagamento)
+    db_pagamento = await models.lista_pagamentos(db=db, id_pagamento=id_pagamento)
     if db_pagamento is None:
         raise HTTPException(status_code=404, detail="Pagamento não encontrado")
     return db_pagamento
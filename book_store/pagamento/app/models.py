@@ -1,7 +1,9 @@
-from sqlalchemy import Column, Integer, String
-from sqlalchemy.orm import Session
+from sqlalchemy import Column, Integer, String, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from .databases import Base
+from . import logger
 
 # Define a classe PagamentoBase
 class PagamentoBase(BaseModel):
@@ -9,7 +11,7 @@ class PagamentoBase(BaseModel):
 
 # Define a classe PagamentoCreate
 class PagamentoCreate(PagamentoBase):
-    pass
+    token: str | None = None # Assinatura da ordem gerada pelo serviço de ordem de compra
 
 # Define a classe Pagamento
 class Pagamento(PagamentoBase):
@@ -19,34 +21,92 @@ class Pagamento(PagamentoBase):
     class Config:
         from_attributes = True
 
+# Define a classe PagamentoLote com as ordens de um envio em lote
+class PagamentoLote(BaseModel):
+    id_ordens: list[int]
+    tokens: dict[int, str | None] = {} # Assinatura de cada ordem, pelo id da ordem
+
+# Define a classe PagamentoLoteResultado com o resultado de um envio em lote
+class PagamentoLoteResultado(BaseModel):
+    pagamentos: list[Pagamento]
+    nao_encontradas: list[int]
+
 # Define a classe Pagamento
 class PagamentoDB(Base):
     __tablename__ = 'pagamentos'
     id = Column(Integer, primary_key=True, index=True)
-    id_ordem = Column(Integer, index=True)
+    id_ordem = Column(Integer, index=True, unique=True) # Uma ordem tem no máximo um pagamento
     status = Column(String)
+    chave_idempotencia = Column(String, unique=True) # Valor do cabeçalho Idempotency-Key da requisição que criou o pagamento
 
 # Função que processa o pagamento de uma ordem
-def processar_pagamento(db: Session, pagamento: PagamentoCreate, status: str):
+async def processar_pagamento(db: AsyncSession, pagamento: PagamentoCreate, status: str, chave_idempotencia: str | None = None):
     """"
-    Função que cria um pagamento no banco de dados
+    Função que cria um pagamento no banco de dados.
+
+    Se a chave de idempotência ou a ordem já tiverem pagamento, retorna o
+    pagamento existente.
+    """
+    try:
+        await db.execute(
+            insert(PagamentoDB)
+            .values(id_ordem=pagamento.id_ordem, status=status, chave_idempotencia=chave_idempotencia)
+            .on_conflict_do_nothing()
+        )
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        logger.error("Erro ao criar pagamento da ordem %s: %s", pagamento.id_ordem, e)
+        raise
+
+    if chave_idempotencia is not None:
+        db_pagamento = await busca_pagamento_por_chave(db, chave_idempotencia)
+        if db_pagamento is not None:
+            return db_pagamento
+    return (await db.scalars(select(PagamentoDB).where(PagamentoDB.id_ordem == pagamento.id_ordem))).first()
+
+# Função que retorna o pagamento criado com uma chave de idempotência
+async def busca_pagamento_por_chave(db: AsyncSession, chave_idempotencia: str):
+    """
+    Função que retorna o pagamento criado com a chave de idempotência informada
     """
-    db_pagamento = PagamentoDB(
-        id_ordem=pagamento.id_ordem,
-        status=status
-    )
-    db.add(db_pagamento)
-    db.commit()
-    db.refresh(db_pagamento)
-    return db_pagamento
+    try:
+        return await db.scalar(select(PagamentoDB).where(PagamentoDB.chave_idempotencia == chave_idempotencia))
+    except Exception as e:
+        logger.error("Erro ao buscar pagamento com chave de idempotência %s: %s", chave_idempotencia, e)
+        raise
+
+# Função que processa o pagamento de várias ordens
+async def processar_pagamentos(db: AsyncSession, status_por_ordem: dict[int, str]):
+    """
+    Função que cria os pagamentos de várias ordens em uma única transação.
+
+    É idempotente por ordem: se a ordem já tem pagamento, o pagamento
+    existente é retornado e o status recebido é ignorado. Assim o reenvio de
+    uma ordem (entrega at-least-once) nunca cria um segundo pagamento.
+    """
+    try:
+        await db.execute(
+            insert(PagamentoDB)
+            .values([{"id_ordem": id_ordem, "status": status} for id_ordem, status in status_por_ordem.items()])
+            .on_conflict_do_nothing(index_elements=[PagamentoDB.id_ordem])
+        )
+        await db.commit()
+        return (await db.scalars(
+            select(PagamentoDB).where(PagamentoDB.id_ordem.in_(list(status_por_ordem))).order_by(PagamentoDB.id)
+        )).all()
+    except Exception as e:
+        await db.rollback()
+        logger.error("Erro ao criar pagamentos das ordens %s: %s", list(status_por_ordem), e)
+        raise
 
 # Função que lista os pagamento
-def lista_pagamentos(db: Session, id_pagamento: int):
+async def lista_pagamentos(db: AsyncSession, id_pagamento: int):
     """"
     Função que retorna um pagamento do banco de dados
     """
     try:
-        return db.query(PagamentoDB).filter(PagamentoDB.id == id_pagamento).first()
+        return await db.scalar(select(PagamentoDB).where(PagamentoDB.id == id_pagamento))
     except Exception as e:
-        logger.error(f"Erro ao buscar pagamento com id {id_pagamento}: {e}")
+        logger.error("Erro ao buscar pagamento com id %s: %s", id_pagamento, e)
         raise
@@ -33,12 +33,12 @@ def initialize_database():
     """
     try:
         if not database_exists(engine.url):
-            logger.info(f"Banco de dados {DB_NAME} não existe. Criando...")
+            logger.info("Banco de dados %s não existe. Criando...", DB_NAME)
             create_database(engine.url)
         else:
-            logger.info(f"Banco de dados {DB_NAME} já existe.")
+            logger.info("Banco de dados %s já existe.", DB_NAME)
     except Exception as e:
-        logger.error(f"Erro ao inicializar o banco de dados: {e}")
+        logger.error("Erro ao inicializar o banco de dados: %s", e)
         raise
 
 initialize_database()
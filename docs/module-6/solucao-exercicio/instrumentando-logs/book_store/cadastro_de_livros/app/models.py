@@ -1,12 +1,19 @@
 """
 Modulo responsável por manipular os dados do banco de dados
 """
-from sqlalchemy import Column, Integer, String
+import os
+import threading
+import time
+from opentelemetry.metrics import Observation
+from sqlalchemy import Column, Integer, String, func, select
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from .databases import Base
+from .databases import Base, SessionLocal
 from .logs import logger
-from .metrics import livros_cadastrados, estoque_livros
+from .metrics import meter, livros_cadastrados
+
+# Obtém o intervalo em segundos entre os cálculos do estoque total
+ESTOQUE_INTERVALO = float(os.getenv("ESTOQUE_INTERVALO", "60"))
 
 # Modelo Pydantic para para entrada livre de dados
 class LivroBase(BaseModel):
@@ -23,6 +30,65 @@ class Livros(Base):
     titulo = Column(String, index=True)
     estoque = Column(Integer)
 
+# Define o estoque total calculado periodicamente para a métrica estoque_livros
+class EstoqueTotal:
+    """
+    Soma do estoque de todos os livros, recalculada com SELECT sum(estoque)
+    por uma thread em segundo plano a cada `intervalo` segundos.
+
+    A callback da métrica só lê o último total, então a coleta não executa
+    a consulta. As escritas não mantêm nenhum agregado, então criar ou
+    remover livros não disputa uma linha compartilhada. Como o valor é lido
+    do banco de dados, todos os processos do serviço reportam o mesmo total,
+    com até `intervalo` segundos de atraso em relação às escritas.
+    """
+    def __init__(self, intervalo: float):
+        self.intervalo = intervalo
+        self.total = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def calcula(self):
+        """
+        Calcula o total. Se o cálculo falhar, o total fica None e a métrica
+        não é reportada até o próximo cálculo.
+        """
+        try:
+            with SessionLocal() as db:
+                self.total = db.scalar(select(func.coalesce(func.sum(Livros.estoque), 0)))
+        except Exception as e:
+            self.total = None
+            logger.error("Erro ao calcular o estoque total: %s", e)
+
+    def _executa(self):
+        while True:
+            self.calcula()
+            time.sleep(self.intervalo)
+
+    def inicia(self):
+        """
+        Inicia a thread que recalcula o total, uma única vez por processo.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._executa, name="estoque-total", daemon=True)
+                self._thread.start()
+
+estoque_total = EstoqueTotal(intervalo=ESTOQUE_INTERVALO)
+
+# Função de callback chamada pela thread de exportação das métricas
+def observa_estoque_livros(options):
+    total = estoque_total.total
+    if total is not None:
+        yield Observation(total)
+
+estoque_livros = meter.create_observable_gauge(
+    name="bookstore.estoque.livros",
+    callbacks=[observa_estoque_livros],
+    description="Quantidade de livros em estoque (soma do estoque de todos os livros)",
+    unit="number",
+)
+
 # Função que cria um livro no banco de dados
 def cria_livro(db: Session, livro: LivroBase):
     """
@@ -36,13 +102,10 @@ def cria_livro(db: Session, livro: LivroBase):
 
         # Incrementa a métrica total_livros_cadastrados
         livros_cadastrados.add(1)
-
-        # Atualiza a métrica estoque_livros
-        estoque_livros.set(db.query(Livros).count())
         
         return db_livro
     except Exception as e:
-        logger.error(f"Erro ao criar livro no banco de dados: {e}")
+        logger.error("Erro ao criar livro no banco de dados: %s", e)
         raise
 
 # Função que remove um livro do banco de dados
@@ -56,12 +119,9 @@ def remove_livro(db: Session, livro_id: int):
             db.delete(db_livro)
             db.commit()
             
-            # Atualiza a métrica estoque_livros
-            estoque_livros.set(db.query(Livros).count())
-            
             return db_livro
     except Exception as e:
-        logger.error(f"Erro ao remover livro do banco de dados: {e}")
+        logger.error("Erro ao remover livro do banco de dados: %s", e)
         raise
 
 # Função que retorna todos os livros do banco de dados
@@ -72,7 +132,7 @@ def lista_livros(db: Session):
     try:
         return db.query(Livros).all()
     except Exception as e:
-        logger.error(f"Erro ao listar livros: {e}")
+        logger.error("Erro ao listar livros: %s", e)
         raise
 
 # Função que retorna um livro do banco de dados
@@ -83,5 +143,5 @@ def busca_livro(db: Session, livro_id: int):
     try:
         return db.query(Livros).filter(Livros.id == livro_id).first()
     except Exception as e:
-        logger.error(f"Erro ao buscar livro com id {livro_id}: {e}")
+        logger.error("Erro ao buscar livro com id %s: %s", livro_id, e)
         raise
@@ -6,7 +6,15 @@ from opentelemetry import trace
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.sampling import ParentBased
 from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+from .amostragem import (
+    TRACE_AMOSTRAGEM_CAUDA,
+    TRACE_AMOSTRAGEM_ROTAS,
+    AmostragemCaudaProcessor,
+    AmostragemRotaSampler,
+    carrega_taxas,
+)
 
 def configure_tracer():
     """
@@ -25,9 +33,14 @@ def configure_tracer():
         "deployment.environment": "dev"        # Ambiente de implantação
     })
     
+    # Define a taxa de amostragem de cada rota; spans filhos seguem a decisão do pai
+    sampler = ParentBased(root=AmostragemRotaSampler(carrega_taxas(TRACE_AMOSTRAGEM_ROTAS)))
+
     # Configura o TracerProvider
-    provider = TracerProvider(resource=resource) # Define o recurso
+    provider = TracerProvider(resource=resource, sampler=sampler) # Define o recurso e o sampler
     processor = BatchSpanProcessor(exporter)     # Define o exportador
+    if TRACE_AMOSTRAGEM_CAUDA:
+        processor = AmostragemCaudaProcessor(processor) # Exporta somente os traces mantidos pela amostragem por cauda
     provider.add_span_processor(processor)       # Adiciona o exportador ao provider
     trace.set_tracer_provider(provider)          # Define o provider como o provider padrão
     
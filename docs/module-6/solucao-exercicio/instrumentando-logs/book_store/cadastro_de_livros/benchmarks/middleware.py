@@ -0,0 +1,139 @@
+"""
+Benchmark do custo por requisição da instrumentação das rotas.
+
+Compara três versões da mesma rota GET /livros/{id}:
+
+- sem_instrumentacao: rota sem spans
+- antes: span criado na rota, cinco set_attribute a partir do Request e span filho "response"
+- depois: span criado pelo SpanRotaMiddleware a partir do scope ASGI
+
+As requisições são enviadas diretamente para a aplicação ASGI, sem servidor
+e sem rede, e os spans são criados pelo SDK sem exportador. O tempo medido é
+portanto só o custo do FastAPI mais a instrumentação.
+
+Uso, no diretório cadastro_de_livros:
+
+    python -m benchmarks.middleware [requisicoes]
+"""
+import asyncio
+import sys
+import time
+from fastapi import FastAPI, Request
+from opentelemetry import trace
+from opentelemetry.sdk.trace import SpanProcessor, TracerProvider
+from opentelemetry.semconv.trace import SpanAttributes
+from opentelemetry.trace import Status, StatusCode
+from app.middleware import SpanRotaMiddleware
+
+# Define o processador que só conta os spans encerrados
+class ContaSpans(SpanProcessor):
+    def __init__(self):
+        self.total = 0
+
+    def on_end(self, span):
+        self.total += 1
+
+contador = ContaSpans()
+provider = TracerProvider()
+provider.add_span_processor(contador)
+tracer = provider.get_tracer(__name__)
+
+LIVRO = {"id": 1, "titulo": "Livro", "estoque": 10}
+
+# Cria a aplicação sem instrumentação
+def cria_app_sem_instrumentacao():
+    app = FastAPI()
+
+    @app.get("/livros/{id}")
+    async def busca_livro(id: int):
+        return LIVRO
+
+    return app
+
+# Cria a aplicação com a instrumentação feita em cada rota
+def cria_app_antes():
+    app = FastAPI()
+
+    @app.get("/livros/{id}")
+    async def busca_livro(request: Request, id: int):
+        with tracer.start_as_current_span("busca_livro") as span:
+            span.set_attribute(SpanAttributes.HTTP_METHOD, request.method)
+            span.set_attribute(SpanAttributes.HTTP_STATUS_CODE, 200)
+            span.set_attribute(SpanAttributes.HTTP_URL, str(request.url))
+            span.set_attribute(SpanAttributes.CLIENT_ADDRESS, str(request.client.host))
+            span.set_attribute(SpanAttributes.CLIENT_PORT, str(request.client.port))
+            span.add_event("Livro encontrado com sucesso", attributes={"id": LIVRO["id"], "titulo": LIVRO["titulo"]})
+            span.set_status(Status(StatusCode.OK))
+            with tracer.start_as_current_span("response") as span:
+                span.set_attribute(SpanAttributes.HTTP_RESPONSE_STATUS_CODE, 200)
+                span.set_attribute(SpanAttributes.EVENT_NAME, "response")
+                span.set_status(Status(StatusCode.OK))
+                return LIVRO
+
+    return app
+
+# Cria a aplicação com a instrumentação feita pelo middleware
+def cria_app_depois(span_response: bool = False):
+    app = FastAPI()
+    app.add_middleware(SpanRotaMiddleware, tracer=tracer, rotas=app.routes, span_response=span_response)
+
+    @app.get("/livros/{id}")
+    async def busca_livro(id: int):
+        span = trace.get_current_span()
+        span.add_event("Livro encontrado com sucesso", attributes={"id": LIVRO["id"], "titulo": LIVRO["titulo"]})
+        span.set_status(Status(StatusCode.OK))
+        return LIVRO
+
+    return app
+
+# Envia `requisicoes` requisições para a aplicação ASGI e retorna o tempo médio em microssegundos
+async def mede(app, requisicoes: int):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/livros/1",
+        "raw_path": b"/livros/1",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"localhost:8080")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("localhost", 8080),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(mensagem):
+        pass
+
+    # Aquece a aplicação (montagem do middleware e caches do FastAPI)
+    for _ in range(200):
+        await app(dict(scope), receive, send)
+
+    inicio = time.perf_counter()
+    for _ in range(requisicoes):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - inicio) / requisicoes * 1_000_000
+
+async def main(requisicoes: int):
+    versoes = [
+        ("sem_instrumentacao", cria_app_sem_instrumentacao()),
+        ("antes", cria_app_antes()),
+        ("depois", cria_app_depois()),
+        ("depois_com_response", cria_app_depois(span_response=True)),
+    ]
+    base = None
+    print(f"{'versão':<22}{'µs/req':>10}{'overhead µs':>14}{'spans/req':>12}")
+    for nome, app in versoes:
+        contador.total = 0
+        media = await mede(app, requisicoes)
+        spans = contador.total / (requisicoes + 200)
+        if base is None:
+            base = media
+        print(f"{nome:<22}{media:>10.1f}{media - base:>14.1f}{spans:>12.1f}")
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000))
@@ -0,0 +1,140 @@
+"""
+Módulo responsável pelas consultas de livros ao serviço de cadastro de livros
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+import requests
+from opentelemetry import trace
+from .metrics import consultas_livro
+from .resiliencia import cadastro_de_livros
+
+# Obtém a url do serviço de cadastro de livros
+BOOK_URL = os.getenv("BOOK_URL", "http://cadastro_de_livros:8080")
+
+# Obtém a configuração do cache de livros das variáveis de ambiente
+LIVRO_CACHE_TTL = float(os.getenv("LIVRO_CACHE_TTL", "2"))
+LIVRO_CACHE_TAMANHO = int(os.getenv("LIVRO_CACHE_TAMANHO", "1024"))
+
+# Define a classe que agrupa chamadas concorrentes com a mesma chave
+class ChamadaUnica:
+    """
+    Executa uma única vez as chamadas concorrentes com a mesma chave.
+
+    A primeira thread que chama `executa` com uma chave executa a função; as
+    que chegam enquanto ela está em andamento aguardam e recebem o mesmo
+    resultado, ou a mesma exceção. Terminada a execução, a próxima chamada
+    com a chave executa a função novamente.
+    """
+    def __init__(self):
+        self._em_andamento = {}
+        self._lock = threading.Lock()
+
+    def executa(self, chave, funcao):
+        """
+        Retorna (resultado, agrupada), onde `agrupada` indica que o resultado
+        veio da execução iniciada por outra thread.
+        """
+        with self._lock:
+            futuro = self._em_andamento.get(chave)
+            agrupada = futuro is not None
+            if not agrupada:
+                futuro = self._em_andamento[chave] = Future()
+        if agrupada:
+            return futuro.result(), True
+
+        try:
+            resultado = funcao()
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado, False
+        finally:
+            with self._lock:
+                del self._em_andamento[chave]
+
+# Define o cache das respostas do serviço de cadastro de livros
+class CacheLivros:
+    """
+    Guarda por LIVRO_CACHE_TTL segundos a resposta do serviço de cadastro para
+    cada livro, limitado a `tamanho` livros.
+
+    O TTL é curto porque o estoque muda a cada venda: o cache só absorve as
+    rajadas de ordens do mesmo livro. As rotas de ordem são síncronas e rodam
+    no pool de threads do FastAPI, e a thread que executa a consulta da
+    ChamadaUnica grava aqui enquanto outras leem, por isso o lock. Quando o
+    cache enche, sai o livro consultado há mais tempo.
+    """
+    def __init__(self, tamanho: int, ttl: float):
+        self.tamanho = tamanho
+        self.ttl = ttl
+        self._respostas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def busca(self, id_livro: int):
+        """
+        Retorna a resposta guardada para o livro ou None se não houver ou se expirou.
+        """
+        agora = time.monotonic()
+        with self._lock:
+            resposta, expira_em = self._respostas.get(id_livro, (None, agora))
+            if expira_em <= agora:
+                self._respostas.pop(id_livro, None)
+                return None
+            self._respostas.move_to_end(id_livro)
+            return resposta
+
+    def guarda(self, id_livro: int, resposta):
+        """
+        Guarda a resposta do livro, removendo o livro mais antigo se passar do tamanho.
+        """
+        with self._lock:
+            self._respostas[id_livro] = (resposta, time.monotonic() + self.ttl)
+            self._respostas.move_to_end(id_livro)
+            if len(self._respostas) > self.tamanho:
+                self._respostas.popitem(last=False)
+
+# Cache das respostas do serviço de cadastro de livros e consultas em andamento por livro
+livros_cache = CacheLivros(tamanho=LIVRO_CACHE_TAMANHO, ttl=LIVRO_CACHE_TTL)
+consultas_em_andamento = ChamadaUnica()
+
+# Consulta um livro no serviço de cadastro de livros
+def _consulta_livro(id_livro: int):
+    """
+    Retorna (status da resposta, livro ou None) e armazena no cache as
+    respostas 200 e 404. Outros status não são armazenados.
+    """
+    livro_response = cadastro_de_livros.chama(
+        lambda timeout: requests.get(f"{BOOK_URL}/livros/{id_livro}", timeout=timeout)
+    )
+    livro = livro_response.json() if livro_response.status_code == 200 else None
+    resultado = (livro_response.status_code, livro)
+    if livro_response.status_code in (200, 404):
+        livros_cache.guarda(id_livro, resultado)
+    return resultado
+
+# Busca um livro no cache ou no serviço de cadastro de livros
+def busca_livro(id_livro: int):
+    """
+    Retorna (status da resposta, livro ou None) do serviço de cadastro de livros.
+
+    A resposta fica no cache por LIVRO_CACHE_TTL segundos, e consultas
+    concorrentes ao mesmo livro que não estão no cache compartilham uma única
+    requisição. A origem da resposta (cache, agrupada ou servico) é
+    registrada na métrica bookstore.catalogo.consultas e no atributo
+    livro.origem do span atual.
+    """
+    resultado = livros_cache.busca(id_livro)
+    if resultado is not None:
+        origem = "cache"
+    else:
+        resultado, agrupada = consultas_em_andamento.executa(id_livro, lambda: _consulta_livro(id_livro))
+        origem = "agrupada" if agrupada else "servico"
+
+    consultas_livro.add(1, {"origem": origem})
+    trace.get_current_span().set_attribute("livro.origem", origem)
+    return resultado
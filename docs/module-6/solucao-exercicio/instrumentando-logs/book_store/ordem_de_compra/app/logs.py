@@ -1,12 +1,68 @@
 """
 Módulo para configurar o LoggerProvider do OpenTelemetry
 """
+import atexit
 import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from opentelemetry import context
 from opentelemetry._logs import set_logger_provider
 from opentelemetry.exporter.otlp.proto.http._log_exporter import OTLPLogExporter
 from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
 from opentelemetry.sdk._logs.export import BatchLogRecordProcessor
 from opentelemetry.sdk.resources import Resource
+from .metrics import logs_descartados
+
+# Obtém o tamanho máximo da fila de logs das variáveis de ambiente
+LOG_FILA_TAMANHO = int(os.getenv("LOG_FILA_TAMANHO", "10000"))
+
+# Define o handler que envia os registros para a fila de logs
+class FilaLogHandler(QueueHandler):
+    """
+    QueueHandler com fila limitada que descarta o registro quando a fila está cheia.
+
+    A thread que chama o logger só monta a mensagem e guarda o contexto do
+    OpenTelemetry no registro; o envio para o coletor fica com a thread do
+    FilaLogListener, então um coletor lento nunca atrasa uma requisição. A
+    quantidade de registros descartados fica em `descartados` e na métrica
+    bookstore.logs.descartados.
+    """
+    def __init__(self, tamanho: int):
+        super().__init__(queue.Queue(maxsize=tamanho))
+        self.descartados = 0
+
+    def prepare(self, record):
+        # A fila é do próprio processo, então o registro não precisa ser serializável
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.contexto_otel = context.get_current()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+            logs_descartados.add(1)
+
+# Define o listener que repassa os registros da fila para os handlers
+class FilaLogListener(QueueListener):
+    """
+    QueueListener que restaura o contexto do OpenTelemetry de cada registro
+    antes de repassá-lo aos handlers, para que o LoggingHandler associe o
+    log ao span da requisição.
+    """
+    def handle(self, record):
+        # Remove o contexto do registro, pois ele não é um atributo de log válido
+        contexto = record.__dict__.pop("contexto_otel", None)
+        token = context.attach(contexto) if contexto is not None else None
+        try:
+            super().handle(record)
+        finally:
+            if token is not None:
+                context.detach(token)
 
 # Configura o exportador de logs
 exporter = OTLPLogExporter(
@@ -25,9 +81,13 @@ provider = LoggerProvider(resource=resource)
 provider.add_log_record_processor(BatchLogRecordProcessor(exporter))
 set_logger_provider(provider)
 
-# Configura o handler OpenTelemetry para logging padrão
+# Configura o handler OpenTelemetry para logging padrão, atrás da fila de logs
 handler = LoggingHandler(logger_provider=provider)
-logging.basicConfig(handlers=[handler], level=logging.INFO, force=True)
+fila_handler = FilaLogHandler(LOG_FILA_TAMANHO)
+listener = FilaLogListener(fila_handler.queue, handler)
+listener.start()
+atexit.register(listener.stop)
+logging.basicConfig(handlers=[fila_handler], level=logging.INFO, force=True)
 
 # Cria o logger global
 logger = logging.getLogger(__name__)
@@ -2,16 +2,33 @@
 """
 Módulo para configurar o MeterProvider do OpenTelemetry
 """
+import threading
 from opentelemetry import metrics
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.metrics import MeterProvider
 from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader  # Importante!
 from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
 
+# Medidor do serviço, criado uma única vez por processo
+_meter = None
+_meter_lock = threading.Lock()
+
 def configure_meter():
     """
     Configura medidor com OpenTelemetry.
+
+    O exportador, o leitor e o provedor são criados somente na primeira
+    chamada. As chamadas seguintes retornam o mesmo medidor, então o processo
+    tem uma única thread de exportação e envia um único POST por intervalo.
     """
+    global _meter
+    with _meter_lock:
+        if _meter is None:
+            _meter = _cria_meter()
+    return _meter
+
+# Cria o exportador, o leitor e o provedor de métricas do processo
+def _cria_meter():
     # Configura o exportador de métricas
     exporter = OTLPMetricExporter(
         endpoint="http://otelcollector:4318/v1/metrics",               
@@ -37,20 +54,51 @@ def configure_meter():
     # Retorna o medidor para criar métricas
     return metrics.get_meter(__name__)
 
+# Obtém o medidor compartilhado do serviço
+meter = configure_meter()
+
 """
 Definição das métricas do sistema de pagamento
 """
 
 # Cria a métrica para contar a quantidade de ordens de compra
-ordem_compra = configure_meter().create_counter(
+ordem_compra = meter.create_counter(
     name="bookstore.ordem.compra",
     description="Quantidade de ordens de compra",
     unit="number",
 )
 
 # Cria a métrica para medir o tempo de processamento de uma ordem de compra
-duracao_ordem = configure_meter().create_histogram(
+duracao_ordem = meter.create_histogram(
     name="bookstore.duracao.ordem",
     description="Tempo de processamento de uma ordem de compra",
     unit="ms"
 )
+
+# Cria a métrica para contar os traces mantidos e descartados pela amostragem por cauda
+traces_amostrados = meter.create_counter(
+    name="bookstore.traces.amostrados",
+    description="Traces decididos pela amostragem por cauda, pelo atributo decisao (mantido ou descartado)",
+    unit="number",
+)
+
+# Cria a métrica para contar os registros de log descartados porque a fila de logs estava cheia
+logs_descartados = meter.create_counter(
+    name="bookstore.logs.descartados",
+    description="Registros de log descartados porque a fila de logs estava cheia",
+    unit="number",
+)
+
+# Cria a métrica para contar as consultas de livro pela origem da resposta
+consultas_livro = meter.create_counter(
+    name="bookstore.catalogo.consultas",
+    description="Consultas de livro pela origem da resposta: cache, agrupada (compartilhou a requisição de outra consulta) ou servico",
+    unit="number",
+)
+
+# Cria a métrica para contar as chamadas recusadas pelo circuit breaker ou pelo limite de concorrência
+dependencia_rejeicoes = meter.create_counter(
+    name="bookstore.dependencia.rejeicoes",
+    description="Chamadas a outros serviços recusadas, pelos atributos dependencia e motivo (circuito_aberto ou limite)",
+    unit="number",
+)
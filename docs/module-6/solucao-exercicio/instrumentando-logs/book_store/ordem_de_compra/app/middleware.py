@@ -0,0 +1,115 @@
+"""
+Módulo com o middleware ASGI que cria o span de cada rota
+"""
+import os
+from opentelemetry import trace
+from opentelemetry.semconv.trace import SpanAttributes
+from opentelemetry.trace import Status, StatusCode
+from fastapi.routing import APIRoute
+
+# Cria o span filho "response" durante o envio da resposta (true ou false)
+SPAN_RESPONSE = os.getenv("SPAN_RESPONSE", "false").lower() == "true"
+
+# Monta a URL da requisição a partir do scope ASGI
+def url_requisicao(scope):
+    """
+    Retorna a URL da requisição sem criar um objeto Request.
+    """
+    url = scope.get("root_path", "") + scope["path"]
+    servidor = scope.get("server")
+    if servidor:
+        url = f"{scope.get('scheme', 'http')}://{servidor[0]}:{servidor[1]}{url}"
+    if scope.get("query_string"):
+        url += "?" + scope["query_string"].decode("latin-1")
+    return url
+
+# Define o middleware que cria o span de cada rota
+class SpanRotaMiddleware:
+    """
+    Middleware ASGI que cria um span por requisição com os atributos HTTP.
+
+    Os atributos são lidos uma única vez do scope ASGI e passados na criação
+    do span, então também ficam disponíveis para o sampler. O span recebe o
+    nome da função da rota (ex. cria_livro) e as rotas obtêm o span com
+    trace.get_current_span() para registrar eventos. O span filho "response"
+    só é criado com `span_response=True`.
+    """
+    def __init__(self, app, tracer, rotas, span_response: bool = SPAN_RESPONSE):
+        self.app = app
+        self.tracer = tracer
+        # Lista de rotas da aplicação; é a mesma lista preenchida pelos decorators @app.get/@app.post
+        self.rotas = rotas
+        self.span_response = span_response
+        self._rotas_api = None
+
+    def busca_rota(self, scope):
+        """
+        Retorna a rota que atende a requisição ou None.
+
+        Compara somente o método e a expressão regular do caminho das rotas da
+        API, sem converter os parâmetros como o roteador do FastAPI faz.
+        """
+        if self._rotas_api is None:
+            # As rotas já estão todas registradas quando a primeira requisição chega
+            self._rotas_api = [
+                (rota.path_regex.match, rota.methods, rota) for rota in self.rotas if isinstance(rota, APIRoute)
+            ]
+        caminho = scope["path"]
+        metodo = scope["method"]
+        for match, metodos, rota in self._rotas_api:
+            if metodo in metodos and match(caminho):
+                return rota
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Define os atributos semânticos do span a partir do scope
+        atributos = {
+            SpanAttributes.HTTP_METHOD: scope["method"],
+            SpanAttributes.HTTP_URL: url_requisicao(scope),
+        }
+        cliente = scope.get("client")
+        if cliente:
+            atributos[SpanAttributes.CLIENT_ADDRESS] = cliente[0]
+            atributos[SpanAttributes.CLIENT_PORT] = cliente[1]
+        rota = self.busca_rota(scope)
+        if rota is not None:
+            nome = rota.name
+            atributos[SpanAttributes.HTTP_ROUTE] = rota.path
+        else:
+            nome = f"HTTP {scope['method']}"
+
+        with self.tracer.start_as_current_span(nome, attributes=atributos) as span:
+            contexto = trace.set_span_in_context(span)
+            span_response = None
+
+            # Registra o status da resposta e, se configurado, o span de envio da resposta
+            async def envia(mensagem):
+                nonlocal span_response
+                if mensagem["type"] == "http.response.start":
+                    status = mensagem["status"]
+                    span.set_attribute(SpanAttributes.HTTP_STATUS_CODE, status)
+                    if status >= 500:
+                        span.set_status(Status(StatusCode.ERROR))
+                    if self.span_response:
+                        span_response = self.tracer.start_span(
+                            "response",
+                            context=contexto,
+                            attributes={
+                                SpanAttributes.HTTP_RESPONSE_STATUS_CODE: status,
+                                SpanAttributes.EVENT_NAME: "response",
+                            },
+                        )
+                await send(mensagem)
+                if span_response is not None and mensagem["type"] == "http.response.body" and not mensagem.get("more_body", False):
+                    span_response.end()
+                    span_response = None
+
+            try:
+                await self.app(scope, receive, envia)
+            finally:
+                if span_response is not None:
+                    span_response.end()
@@ -57,5 +57,5 @@ def lista_ordem(db: Session, id_ordem: int):
     try:
         return db.query(OrdemDB).filter(OrdemDB.id == id_ordem).first()
     except Exception as e:
-        logger.error(f"Erro ao buscar ordem com id {id_ordem}: {e}")
+        logger.error("Erro ao buscar ordem com id %s: %s", id_ordem, e)
         raise
@@ -0,0 +1,214 @@
+"""
+Módulo com a proteção das chamadas aos outros serviços: circuit breaker e
+limite de concorrência adaptativo (AIMD) por serviço
+"""
+import os
+import threading
+import time
+from opentelemetry import trace
+from opentelemetry.metrics import Observation
+from .metrics import meter, dependencia_rejeicoes
+
+# Define a exceção das chamadas recusadas sem acessar o serviço
+class ServicoIndisponivel(Exception):
+    """
+    A chamada foi recusada porque o circuito está aberto ou o limite de
+    chamadas simultâneas ao serviço foi atingido.
+    """
+
+# Define o circuit breaker de um serviço
+class Circuito:
+    """
+    Circuit breaker com os estados fechado, aberto e meio_aberto.
+
+    Fechado, todas as chamadas passam. Após `falhas` falhas seguidas o
+    circuito abre e recusa as chamadas por `tempo_aberto` segundos. Depois
+    disso fica meio_aberto e deixa passar uma única chamada de teste: se ela
+    funcionar o circuito fecha, senão abre novamente.
+    Não é thread-safe: o lock fica com a Dependencia.
+    """
+    FECHADO = "fechado"
+    MEIO_ABERTO = "meio_aberto"
+    ABERTO = "aberto"
+
+    def __init__(self, falhas: int, tempo_aberto: float):
+        self.falhas = falhas
+        self.tempo_aberto = tempo_aberto
+        self.estado = self.FECHADO
+        self._falhas_seguidas = 0
+        self._aberto_ate = 0.0
+        self._teste_em_andamento = False
+
+    def permite(self):
+        """
+        Retorna se a chamada pode ser feita, passando de aberto para
+        meio_aberto quando o tempo aberto termina.
+        """
+        if self.estado == self.ABERTO:
+            if time.monotonic() < self._aberto_ate:
+                return False
+            self.estado = self.MEIO_ABERTO
+        if self.estado == self.MEIO_ABERTO:
+            if self._teste_em_andamento:
+                return False
+            self._teste_em_andamento = True
+        return True
+
+    def registra(self, sucesso: bool):
+        """
+        Registra o resultado de uma chamada.
+        """
+        if sucesso:
+            self._falhas_seguidas = 0
+            self._teste_em_andamento = False
+            self.estado = self.FECHADO
+            return
+        if self.estado == self.ABERTO:
+            # Chamada iniciada antes da abertura: não prolonga o tempo aberto
+            return
+        self._falhas_seguidas += 1
+        if self.estado == self.MEIO_ABERTO or self._falhas_seguidas >= self.falhas:
+            self._teste_em_andamento = False
+            self.estado = self.ABERTO
+            self._aberto_ate = time.monotonic() + self.tempo_aberto
+
+# Define o limite de chamadas simultâneas com aumento aditivo e redução multiplicativa
+class LimiteAIMD:
+    """
+    Limite de chamadas simultâneas ajustado pelo resultado de cada chamada.
+
+    Uma chamada com sucesso e latência até `latencia_alvo_ms` aumenta o
+    limite em 1, desde que pelo menos metade dele esteja em uso. Uma falha
+    ou uma chamada mais lenta que o alvo multiplica o limite por `reducao`.
+    O limite fica entre `minimo` e `maximo`.
+    Não é thread-safe: o lock fica com a Dependencia.
+    """
+    def __init__(self, inicial: int, minimo: int, maximo: int, latencia_alvo_ms: float, reducao: float = 0.9):
+        self.limite = float(inicial)
+        self.minimo = minimo
+        self.maximo = maximo
+        self.latencia_alvo_ms = latencia_alvo_ms
+        self.reducao = reducao
+        self.em_uso = 0
+
+    def disponivel(self):
+        return self.em_uso < int(self.limite)
+
+    def registra(self, sucesso: bool, latencia_ms: float):
+        """
+        Registra o resultado de uma chamada e ajusta o limite.
+        """
+        if not sucesso or latencia_ms > self.latencia_alvo_ms:
+            self.limite = max(self.minimo, self.limite * self.reducao)
+        elif self.em_uso * 2 >= self.limite:
+            self.limite = min(self.maximo, self.limite + 1)
+
+# Define um serviço chamado por este serviço
+class Dependencia:
+    """
+    Protege as chamadas a um serviço com um Circuito e um LimiteAIMD.
+
+    A configuração vem das variáveis de ambiente com o `prefixo` do serviço
+    (ex. PAYMENT_TIMEOUT, PAYMENT_CIRCUITO_FALHAS). Uma chamada recusada pelo
+    circuito ou pelo limite levanta ServicoIndisponivel na hora, sem ocupar
+    a thread esperando o serviço. Exceções e respostas 5xx contam como falha.
+    O estado é registrado como atributos do span atual e nas métricas
+    bookstore.dependencia.*, com o atributo `dependencia`.
+    """
+    def __init__(self, nome: str, prefixo: str, timeout: float, latencia_alvo_ms: float):
+        self.nome = nome
+        self.timeout = float(os.getenv(f"{prefixo}_TIMEOUT", str(timeout)))
+        self.circuito = Circuito(
+            falhas=int(os.getenv(f"{prefixo}_CIRCUITO_FALHAS", "5")),
+            tempo_aberto=float(os.getenv(f"{prefixo}_CIRCUITO_ABERTO", "10")),
+        )
+        self.limite = LimiteAIMD(
+            inicial=int(os.getenv(f"{prefixo}_LIMITE_INICIAL", "20")),
+            minimo=int(os.getenv(f"{prefixo}_LIMITE_MINIMO", "1")),
+            maximo=int(os.getenv(f"{prefixo}_LIMITE_MAXIMO", "200")),
+            latencia_alvo_ms=float(os.getenv(f"{prefixo}_LATENCIA_ALVO_MS", str(latencia_alvo_ms))),
+        )
+        self._lock = threading.Lock()
+
+    def chama(self, funcao):
+        """
+        Executa `funcao(timeout)`, que faz a requisição ao serviço, e retorna a resposta.
+        """
+        with self._lock:
+            if not self.limite.disponivel():
+                motivo = "limite"
+            elif not self.circuito.permite():
+                motivo = "circuito_aberto"
+            else:
+                motivo = None
+                self.limite.em_uso += 1
+            self._registra_span()
+        if motivo is not None:
+            dependencia_rejeicoes.add(1, {"dependencia": self.nome, "motivo": motivo})
+            raise ServicoIndisponivel(f"Serviço {self.nome} indisponível ({motivo})")
+
+        sucesso = False
+        inicio = time.perf_counter()
+        try:
+            resposta = funcao(self.timeout)
+            sucesso = resposta.status_code < 500
+            return resposta
+        finally:
+            latencia_ms = (time.perf_counter() - inicio) * 1000
+            with self._lock:
+                self.limite.registra(sucesso, latencia_ms)
+                self.limite.em_uso -= 1
+                self.circuito.registra(sucesso)
+
+    def _registra_span(self):
+        trace.get_current_span().set_attributes({
+            f"dependencia.{self.nome}.circuito": self.circuito.estado,
+            f"dependencia.{self.nome}.limite": int(self.limite.limite),
+            f"dependencia.{self.nome}.em_uso": self.limite.em_uso,
+        })
+
+# Serviços chamados pela ordem de compra
+cadastro_de_livros = Dependencia("cadastro_de_livros", prefixo="BOOK", timeout=2, latencia_alvo_ms=500)
+pagamento = Dependencia("pagamento", prefixo="PAYMENT", timeout=5, latencia_alvo_ms=1000)
+dependencias = (cadastro_de_livros, pagamento)
+
+# Valor da métrica de cada estado do circuito
+_ESTADOS_CIRCUITO = {Circuito.FECHADO: 0, Circuito.MEIO_ABERTO: 1, Circuito.ABERTO: 2}
+
+# Funções de callback que leem o estado das dependências
+def observa_circuito(options):
+    for dependencia in dependencias:
+        yield Observation(_ESTADOS_CIRCUITO[dependencia.circuito.estado], {"dependencia": dependencia.nome})
+
+def observa_limite(options):
+    for dependencia in dependencias:
+        yield Observation(int(dependencia.limite.limite), {"dependencia": dependencia.nome})
+
+def observa_em_uso(options):
+    for dependencia in dependencias:
+        yield Observation(dependencia.limite.em_uso, {"dependencia": dependencia.nome})
+
+"""
+Definição das métricas das dependências
+"""
+
+dependencia_circuito = meter.create_observable_gauge(
+    name="bookstore.dependencia.circuito",
+    callbacks=[observa_circuito],
+    description="Estado do circuito de cada dependência: 0 fechado, 1 meio_aberto, 2 aberto",
+    unit="number",
+)
+
+dependencia_limite = meter.create_observable_gauge(
+    name="bookstore.dependencia.limite",
+    callbacks=[observa_limite],
+    description="Limite atual de chamadas simultâneas a cada dependência",
+    unit="number",
+)
+
+dependencia_em_uso = meter.create_observable_gauge(
+    name="bookstore.dependencia.em_uso",
+    callbacks=[observa_em_uso],
+    description="Chamadas em andamento a cada dependência",
+    unit="number",
+)
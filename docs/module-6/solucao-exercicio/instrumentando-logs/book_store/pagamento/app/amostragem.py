@@ -0,0 +1,216 @@
+"""
+Módulo com a amostragem de traces: o sampler por rota (head sampling) e o
+processador de spans que faz a amostragem por cauda (tail-based sampling)
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from opentelemetry.sdk.trace import SpanProcessor
+from opentelemetry.sdk.trace.sampling import Sampler, TraceIdRatioBased
+from opentelemetry.semconv.trace import SpanAttributes
+from opentelemetry.trace import StatusCode
+from .metrics import traces_amostrados
+
+# Obtém a configuração da amostragem das variáveis de ambiente
+TRACE_AMOSTRAGEM_CAUDA = os.getenv("TRACE_AMOSTRAGEM_CAUDA", "false").lower() == "true"
+TRACE_LATENCIA_MS = float(os.getenv("TRACE_LATENCIA_MS", "500"))
+TRACE_TAXA_BASE = float(os.getenv("TRACE_TAXA_BASE", "0.1"))
+TRACE_TIMEOUT = float(os.getenv("TRACE_TIMEOUT", "30"))
+TRACE_MAX_TRACES = int(os.getenv("TRACE_MAX_TRACES", "10000"))
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "1000"))
+TRACE_AMOSTRAGEM_ROTAS = os.getenv("TRACE_AMOSTRAGEM_ROTAS", "")
+TRACE_TAXA_PADRAO = float(os.getenv("TRACE_TAXA_PADRAO", "1.0"))
+
+# Lê as taxas de amostragem por rota
+def carrega_taxas(config: str):
+    """
+    Retorna {regra: taxa} a partir de um objeto JSON ou do caminho de um
+    arquivo JSON, por exemplo {"GET /livros/{id}": 0.01, "cria_ordem": 1.0}.
+    """
+    if not config.strip():
+        return {}
+    if config.lstrip().startswith("{"):
+        taxas = json.loads(config)
+    else:
+        with open(config, encoding="utf-8") as arquivo:
+            taxas = json.load(arquivo)
+    for regra, taxa in taxas.items():
+        if not 0 <= float(taxa) <= 1:
+            raise ValueError(f"Taxa de amostragem inválida para {regra!r}: {taxa}")
+    return taxas
+
+# Define o sampler com taxas de amostragem por rota e por nome de span
+class AmostragemRotaSampler(Sampler):
+    """
+    Aplica uma taxa de amostragem diferente para cada rota ou nome de span.
+
+    As regras podem ser "MÉTODO /rota/{param}", "/rota/{param}" ou o nome do
+    span (ex. busca_livro), nessa ordem de prioridade; spans sem regra usam
+    `taxa_padrao`. As regras são convertidas em dicionários de samplers na
+    criação, então cada decisão custa no máximo três consultas a dicionário.
+    A rota vem do atributo http.route, definido na criação do span pelo
+    SpanRotaMiddleware. Deve ser usado como raiz de um ParentBased, para que
+    os spans filhos sigam a decisão do pai.
+    """
+    def __init__(self, taxas: dict, taxa_padrao: float = TRACE_TAXA_PADRAO):
+        self._por_metodo_rota = {}
+        self._por_rota = {}
+        self._por_nome = {}
+        for regra, taxa in taxas.items():
+            sampler = TraceIdRatioBased(float(taxa))
+            metodo, _, rota = regra.partition(" ")
+            if rota.startswith("/"):
+                self._por_metodo_rota[(metodo.upper(), rota)] = sampler
+            elif regra.startswith("/"):
+                self._por_rota[regra] = sampler
+            else:
+                self._por_nome[regra] = sampler
+        self._padrao = TraceIdRatioBased(taxa_padrao)
+        self._descricao = f"AmostragemRotaSampler{{regras={len(taxas)}, padrao={taxa_padrao}}}"
+
+    def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None, trace_state=None):
+        sampler = None
+        if attributes:
+            rota = attributes.get(SpanAttributes.HTTP_ROUTE)
+            if rota is not None:
+                sampler = self._por_metodo_rota.get((attributes.get(SpanAttributes.HTTP_METHOD), rota)) or self._por_rota.get(rota)
+        if sampler is None:
+            sampler = self._por_nome.get(name, self._padrao)
+        return sampler.should_sample(parent_context, trace_id, name, kind, attributes, links, trace_state)
+
+    def get_description(self):
+        return self._descricao
+
+# Define os spans de um trace aguardando a decisão
+class _TracePendente:
+    __slots__ = ("spans", "erro", "inicio")
+
+    def __init__(self):
+        self.spans = []
+        self.erro = False
+        self.inicio = time.monotonic()
+
+# Define o processador de spans com amostragem por cauda
+class AmostragemCaudaProcessor(SpanProcessor):
+    """
+    Guarda em memória os spans de cada trace e só decide se o trace é
+    exportado quando o span raiz local termina.
+
+    O trace é mantido se algum span terminou com erro, se o span raiz durou
+    `latencia_ms` ou mais, ou com probabilidade `taxa_base`. Somente os
+    traces mantidos são repassados ao `processor` (ex. BatchSpanProcessor).
+
+    A decisão pela `taxa_base` vem do trace id, como no TraceIdRatioBased, e
+    não de um número aleatório: todos os serviços tomam a mesma decisão para
+    o mesmo trace, então um trace sem erro e rápido é mantido ou descartado
+    por inteiro, e não só nos serviços que sortearam mantê-lo.
+
+    A memória é limitada: no máximo `max_traces` traces pendentes, cada um com
+    até `max_spans` spans. Quando o limite é atingido o trace mais antigo é
+    decidido na hora, e um trace cujo span raiz não termina em `timeout`
+    segundos é tratado como lento. Os spans que terminam depois da decisão
+    seguem a decisão já tomada. As quantidades de traces mantidos e
+    descartados ficam em `mantidos` e `descartados` e na métrica
+    bookstore.traces.amostrados.
+    """
+    def __init__(
+        self,
+        processor: SpanProcessor,
+        latencia_ms: float = TRACE_LATENCIA_MS,
+        taxa_base: float = TRACE_TAXA_BASE,
+        timeout: float = TRACE_TIMEOUT,
+        max_traces: int = TRACE_MAX_TRACES,
+        max_spans: int = TRACE_MAX_SPANS,
+    ):
+        self.processor = processor
+        self.latencia_ns = int(latencia_ms * 1_000_000)
+        self.taxa_base = taxa_base
+        self._limite_base = TraceIdRatioBased.get_bound_for_rate(taxa_base)
+        self.timeout = timeout
+        self.max_traces = max_traces
+        self.max_spans = max_spans
+        self._pendentes = OrderedDict()
+        self._decididos = OrderedDict()
+        self._lock = threading.Lock()
+        self.mantidos = 0
+        self.descartados = 0
+
+    def on_start(self, span, parent_context=None):
+        self.processor.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span):
+        trace_id = span.context.trace_id
+        with self._lock:
+            decisao = self._decididos.get(trace_id)
+            if decisao is not None:
+                # O trace já foi decidido: o span segue a decisão
+                exportar = [span] if decisao else []
+            else:
+                pendente = self._pendentes.get(trace_id)
+                if pendente is None:
+                    pendente = self._pendentes[trace_id] = _TracePendente()
+                if len(pendente.spans) < self.max_spans:
+                    pendente.spans.append(span)
+                if span.status.status_code is StatusCode.ERROR:
+                    pendente.erro = True
+
+                exportar = []
+                # O span raiz local terminou: o trace está completo neste processo
+                if span.parent is None or span.parent.is_remote:
+                    lento = span.end_time - span.start_time >= self.latencia_ns
+                    exportar = self._decide(trace_id, lento)
+            exportar.extend(self._decide_antigos())
+
+        for span_exportado in exportar:
+            self.processor.on_end(span_exportado)
+
+    def _decide(self, trace_id, lento: bool):
+        """
+        Remove o trace dos pendentes e retorna os spans a exportar.
+        """
+        pendente = self._pendentes.pop(trace_id)
+        manter = pendente.erro or lento or trace_id & TraceIdRatioBased.TRACE_ID_LIMIT < self._limite_base
+
+        self._decididos[trace_id] = manter
+        if len(self._decididos) > self.max_traces:
+            self._decididos.popitem(last=False)
+
+        if manter:
+            self.mantidos += 1
+            traces_amostrados.add(1, {"decisao": "mantido"})
+            return pendente.spans
+        self.descartados += 1
+        traces_amostrados.add(1, {"decisao": "descartado"})
+        return []
+
+    def _decide_antigos(self, todos: bool = False):
+        """
+        Decide os traces que expiraram ou excedem `max_traces`, do mais antigo
+        para o mais novo.
+        """
+        exportar = []
+        limite = time.monotonic() - self.timeout
+        while self._pendentes:
+            trace_id, pendente = next(iter(self._pendentes.items()))
+            expirado = pendente.inicio <= limite
+            if not (todos or expirado or len(self._pendentes) > self.max_traces):
+                break
+            exportar.extend(self._decide(trace_id, lento=expirado))
+        return exportar
+
+    def shutdown(self):
+        # Decide os traces pendentes antes de encerrar o processador
+        with self._lock:
+            exportar = self._decide_antigos(todos=True)
+        for span in exportar:
+            self.processor.on_end(span)
+        self.processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000):
+        with self._lock:
+            exportar = self._decide_antigos()
+        for span in exportar:
+            self.processor.on_end(span)
+        return self.processor.force_flush(timeout_millis)
@@ -49,5 +49,5 @@ def lista_pagamentos(db: Session, id_pagamento: int):
     try:
         return db.query(PagamentoDB).filter(PagamentoDB.id == id_pagamento).first()
     except Exception as e:
-        logger.error(f"Erro ao buscar pagamento com id {id_pagamento}: {e}")
+        logger.error("Erro ao buscar pagamento com id %s: %s", id_pagamento, e)
         raise